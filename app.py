@@ -20,7 +20,15 @@ from routes.productServices.generate_sign import generate_sign  # noqa: F401
 from routes.productServices.file_handling import file_bp
 from routes.userServices.cookie_login import cookie_login_bp
 from routes.userServices.cookie_test import cookie_test_bp
+from routes.productServices.stock_shards import stock_shards_bp
+from routes.productServices.bulk_products import bulk_products_bp
+from routes.productServices.search_products import search_products_bp
+from routes.orderServices.order_history import order_history_bp
 from config import SQLALCHEMY_DATABASE_URI, SQLALCHEMY_TRACK_MODIFICATIONS, SECRET_KEY, RABBITMQ_CONFIG, ENABLE_TCP_SERVER  # 导入 RABBITMQ_CONFIG
+from config import STOCK_SHARD_CONFIG
+from services.stock_shard_service import start_shard_rebalancer
+from plugin.product_filter import start_product_filter
+from plugin.product_search import start_search_indexer
 import threading
 from tcp_server import start_tcp_server
 import json
@@ -72,6 +80,10 @@ def create_app():
     app.register_blueprint(file_bp)
     app.register_blueprint(cookie_login_bp)
     app.register_blueprint(cookie_test_bp)
+    app.register_blueprint(stock_shards_bp)
+    app.register_blueprint(bulk_products_bp)
+    app.register_blueprint(search_products_bp)
+    app.register_blueprint(order_history_bp)
 
     swagger = Swagger(app)
     return app
@@ -87,4 +99,10 @@ if __name__ == '__main__':
     else:
         print("TCP服务器已禁用，跳过启动")
 
+    start_product_filter(app)
+    start_search_indexer(app)
+
+    if STOCK_SHARD_CONFIG['REBALANCE_INTERVAL']:
+        start_shard_rebalancer(app, STOCK_SHARD_CONFIG['REBALANCE_INTERVAL'])
+
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -52,5 +52,102 @@ RABBITMQ_CONFIG = {
     'VIRTUAL_HOST': '/',
     'QUEUE_NAME': 'flash_sale_queue',
     'HEARTBEAT': 600,
-    'BLOCKED_CONNECTION_TIMEOUT': 300
-}
\ No newline at end of file
+    'BLOCKED_CONNECTION_TIMEOUT': 300,
+    'PUBLISHER_POOL_SIZE': 8,  # 发布通道池大小，每个通道独占一条连接
+    'PUBLISHER_CHECKOUT_TIMEOUT': 0.5,  # 借用发布通道的最长等待时间（秒）
+    'PUBLISHER_RECONNECT_INTERVAL': 5  # 后台重连及心跳维护间隔（秒）
+}
+
+# 秒杀配置
+FLASH_SALE_CONFIG = {
+    'STOCK_GATE': True,  # Redis库存预扣开关，开启后售罄请求直接返回，不访问数据库和消息队列
+    'USER_LIMIT': 1,  # 每个用户在单个商品上的限购数量，0表示不限购
+    'STOCK_TTL': 3600,  # Redis库存键过期时间（秒），过期后从数据库重新加载
+    'CONSUMER_MODE': 'batch',  # 消费模式：single 逐条提交，batch 批量提交
+    'BATCH_SIZE': 100,  # 批量模式下每批最多处理的消息数（同时作为prefetch数量）
+    'BATCH_WAIT': 0.2,  # 批量模式下凑批的最长等待时间（秒）
+    'RESULT_TTL': 600,  # 抢购结果保留时间（秒）
+    'RESULT_MAX_WAIT': 30  # 查询结果接口长轮询的最长等待时间（秒）
+}
+
+
+# 库存分片配置
+STOCK_SHARD_CONFIG = {
+    'DEFAULT_SHARDS': 8,  # 开启分片时的默认分片数
+    'CACHE_TTL': 30,  # 进程内缓存商品分片数的时间（秒），只影响扣减路径的选择，不影响正确性
+    'REBALANCE_INTERVAL': 10  # 后台均衡分片库存并汇总到 Product.stock 的间隔（秒），0表示不启动
+}
+
+# 秒杀消息代理配置
+MESSAGE_BROKER_CONFIG = {
+    'BACKEND': 'amqp',  # amqp: RabbitMQ，redis: Redis Streams，memory: 进程内有界队列
+    'QUEUE_NAME': 'flash_sale_queue',  # 队列名，redis后端下为Stream键名
+    'CONSUMER_THREADS': 1,  # amqp/redis后端的消费线程数
+    'RECONNECT_INTERVAL': 5,  # 消费者断线后重建的间隔（秒）
+    'REDIS_GROUP': 'flash_sale',  # Redis Streams消费者组
+    'REDIS_CLAIM_IDLE': 60,  # 未确认消息空闲超过该时间（秒）后由其他消费者认领重新处理，应大于一批消息的最长处理时间
+    'REDIS_CLAIM_INTERVAL': 30,  # 消费者检查并认领空闲超时消息的间隔（秒）
+    'MEMORY_QUEUE_SIZE': 10000,  # 进程内队列容量，队列满时请求走直接处理模式
+    'MEMORY_WORKERS': 4,  # 进程内队列的消费线程数
+    'PARTITIONS': 1,  # 按商品ID一致性哈希分区的队列数，每个分区只有一个消费者，保证同一商品按顺序处理
+    'EMBEDDED_CONSUMERS': True,  # 在Web进程内启动消费线程；设为False时改用 python -m services.consumer_supervisor
+    'SUPERVISOR_WORKERS': 4,  # 消费进程数，分区按取模分配给各进程
+    'SUPERVISOR_CHECK_INTERVAL': 1,  # 检查消费进程存活的间隔（秒）
+    'SUPERVISOR_LAG_INTERVAL': 10,  # 输出各分区积压的间隔（秒）
+    'MAX_ATTEMPTS': 5,  # 结算异常时的最大处理次数，超过后进入死信队列（<队列名>.dead）
+    'RETRY_DELAYS': [1, 5, 30, 60]  # 第N次重试前的等待时间（秒），次数超出列表时取最后一项
+}
+
+# 进程内商品过滤器配置（已知商品ID、已售罄商品ID）
+PRODUCT_FILTER_CONFIG = {
+    'ENABLED': True,  # 开启后秒杀、加购、库存校验先查进程内过滤器，不存在或已售罄的商品不访问数据库
+    'REFRESH_INTERVAL': 5,  # 从Redis拉取全量集合的间隔（秒），变更事件通过Redis发布订阅实时推送
+    'RESYNC_INTERVAL': 300,  # 从数据库重建集合的间隔（秒），用于修正漏发的变更
+    'MAX_STALENESS': 60  # 超过该时间未成功刷新时过滤器失效，调用方回退到数据库查询（秒）
+}
+
+# 商品缓存配置
+CACHE_CONFIG = {
+    'PRODUCT_TTL': 60,  # 商品列表缓存时间（秒），旧版本号的缓存到期后自动清理
+    'ITEM_TTL': 300,  # 单个商品缓存时间（秒），库存、价格变更时同步写入
+    'ORDER_TTL': 300,  # 订单详情缓存时间（秒），支付或状态变更时删除
+    'COMPRESS_MIN_BYTES': 1024,  # 序列化结果超过该字节数时压缩存储
+    'COMPRESS_LEVEL': 1,  # zlib压缩级别，1最快
+    'LOCAL_SIZE': 1024,  # 进程内缓存最多保存的键数，超出后淘汰最久未使用的
+    'LOCAL_TTL': 2,  # 进程内缓存时间（秒），同时是目录版本号在进程内的缓存时间
+    'EARLY_REFRESH_BETA': 1.0,  # 提前刷新系数，越大越早刷新，0表示不提前刷新
+    'LOAD_TIMEOUT': 10  # 等待同一键上其他请求加载结果的最长时间（秒），超时后自行加载
+}
+
+# 商品批量导入导出配置
+BULK_PRODUCT_CONFIG = {
+    'BATCH_SIZE': 1000,  # 导入时每批插入的行数，每批单独提交
+    'MAX_ERRORS': 1000,  # 错误报告中最多返回的错误行数
+    'EXPORT_CHUNK': 1000  # 导出时每次从服务端游标读取的行数
+}
+
+# 商品搜索配置
+SEARCH_CONFIG = {
+    'REBUILD_INTERVAL': 300,  # 全量重建进程内索引的间隔（秒），用于合并其他进程的商品变更，0表示只在启动时构建
+    'MIN_COVERAGE': 0.5,  # 商品至少命中查询词的比例，低于该比例不返回
+    'MAX_LIMIT': 100  # 单次搜索最多返回的商品数
+}
+
+# 支付配置
+PAYMENT_CONFIG = {
+    'IDEMPOTENCY_TTL': 86400,  # 幂等键保存支付结果的时间（秒），期间重复请求直接返回保存的结果
+    'PENDING_TTL': 30  # 幂等键处理中状态的最长保留时间（秒），进程异常退出后到期可重新发起
+}
+
+# 订单号生成配置（Snowflake：41位毫秒时间戳 + 10位节点号 + 12位序列号）
+ID_GENERATOR_CONFIG = {
+    'EPOCH_MS': 1704067200000,  # 时间戳起点 2024-01-01 00:00:00 UTC，可使用约69年，上线后不能修改
+    'NODE_ID_ENV': 'ORDER_ID_NODE',  # 节点号环境变量（0-1023），设置时必须保证每个进程不同；未设置时从Redis租用
+    'NODE_LEASE_TTL': 60  # Redis节点号租约时间（秒），后台每1/3租约时间续期，进程退出后到期释放
+}
+
+# 订单历史分页配置
+ORDER_HISTORY_CONFIG = {
+    'DEFAULT_LIMIT': 20,  # 每页默认订单行数
+    'MAX_LIMIT': 100  # 每页最多订单行数
+}
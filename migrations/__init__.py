@@ -0,0 +1,18 @@
+"""
+数据库迁移脚本，在项目根目录以 python -m migrations.<脚本名> 执行
+"""
+
+
+def create_migration_app():
+    """迁移只需要数据库，不注册蓝图，避免导入路由模块时连接消息代理、启动内嵌消费线程"""
+    from flask import Flask
+    from db import db
+    from config import SQLALCHEMY_DATABASE_URI, SQLALCHEMY_TRACK_MODIFICATIONS, SQLALCHEMY_ENGINE_OPTIONS
+    app = Flask(__name__)
+    app.config.update({
+        'SQLALCHEMY_DATABASE_URI': SQLALCHEMY_DATABASE_URI,
+        'SQLALCHEMY_TRACK_MODIFICATIONS': SQLALCHEMY_TRACK_MODIFICATIONS,
+        'SQLALCHEMY_ENGINE_OPTIONS': SQLALCHEMY_ENGINE_OPTIONS
+    })
+    db.init_app(app)
+    return app
@@ -0,0 +1,33 @@
+"""
+为已有数据库补建订单历史分页所需的复合索引（新建的数据库由启动时的 db.create_all() 直接创建）
+
+    CREATE INDEX ix_order_user_created ON `order` (user_id, created_at, id);
+    CREATE INDEX ix_order_user_payment_created ON `order` (user_id, payment_status, created_at, id);
+
+在项目根目录执行：python -m migrations.add_order_history_indexes
+已存在的索引会跳过，可以重复执行。MySQL 5.6 及以上添加二级索引时不锁表，期间订单可正常写入。
+"""
+from sqlalchemy import inspect
+from migrations import create_migration_app
+from db import db
+from models import Order
+
+INDEX_NAMES = ('ix_order_user_created', 'ix_order_user_payment_created')
+
+
+def upgrade():
+    existing = {index['name'] for index in inspect(db.engine).get_indexes(Order.__tablename__)}
+    for index in Order.__table__.indexes:
+        if index.name not in INDEX_NAMES:
+            continue
+        if index.name in existing:
+            print(f"索引 {index.name} 已存在，跳过")
+            continue
+        index.create(bind=db.engine)
+        print(f"索引 {index.name} 创建成功")
+
+
+if __name__ == '__main__':
+    app = create_migration_app()
+    with app.app_context():
+        upgrade()
@@ -0,0 +1,41 @@
+"""
+为已有数据库的商品表添加库存分片标记列，并按现有分片回填（新建的数据库由 db.create_all() 直接创建）
+
+    CREATE TABLE product_stock_shard (...);  -- 表不存在时按模型创建
+    ALTER TABLE product ADD COLUMN shard_count INT NOT NULL DEFAULT 0;
+    UPDATE product SET shard_count = (
+        SELECT COUNT(*) FROM product_stock_shard WHERE product_stock_shard.product_id = product.id
+    );
+
+新代码读取该列和分片表，需在部署新代码之前执行。在项目根目录执行：python -m migrations.add_product_shard_count
+表和列已存在时只重新回填，可以重复执行。
+"""
+from sqlalchemy import inspect, text
+from migrations import create_migration_app
+from db import db
+from models import ProductStockShard
+
+
+def upgrade():
+    # 旧数据库还没有分片表，先按模型建表，回填时才能引用
+    if not inspect(db.engine).has_table(ProductStockShard.__tablename__):
+        ProductStockShard.__table__.create(bind=db.engine, checkfirst=True)
+        print(f"表 {ProductStockShard.__tablename__} 创建成功")
+    columns = {column['name'] for column in inspect(db.engine).get_columns('product')}
+    with db.engine.begin() as connection:
+        if 'shard_count' in columns:
+            print("列 product.shard_count 已存在，跳过添加")
+        else:
+            connection.execute(text("ALTER TABLE product ADD COLUMN shard_count INT NOT NULL DEFAULT 0"))
+            print("列 product.shard_count 添加成功")
+        updated = connection.execute(text(
+            "UPDATE product SET shard_count = ("
+            "SELECT COUNT(*) FROM product_stock_shard WHERE product_stock_shard.product_id = product.id)"
+        )).rowcount
+        print(f"已回填 {updated} 个商品的分片数")
+
+
+if __name__ == '__main__':
+    app = create_migration_app()
+    with app.app_context():
+        upgrade()
@@ -2,6 +2,8 @@ import string
 from db import db  # 从 db 导入已初始化的 db 实例
 from datetime import datetime
 import random
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.orm import joinedload
 # 在顶部导入部分添加 timedelta（第4行）
 from datetime import datetime, timedelta
 
@@ -10,6 +12,19 @@ class Product(db.Model):
     name = db.Column(db.String(80), nullable=False)
     price = db.Column(db.Float, nullable=False)
     stock = db.Column(db.Integer, nullable=False)
+    # 库存分片数，0表示未分片；与库存在同一行，扣减商品行库存时作为条件，避免各进程的分片缓存过期前扣错位置
+    shard_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+class ProductStockShard(db.Model):
+    """热门商品的库存分片，开启分片后 Product.stock 仅作为各分片库存之和的汇总视图"""
+    __tablename__ = 'product_stock_shard'
+    __table_args__ = (
+        db.UniqueConstraint('product_id', 'shard_no', name='uq_product_shard'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    shard_no = db.Column(db.Integer, nullable=False)
+    stock = db.Column(db.Integer, nullable=False, default=0)
 
 class User(db.Model):
     __tablename__ = 'user'  # 明确指定表名为user
@@ -34,7 +49,13 @@ class User(db.Model):
         return f"用户{random_str}"
 
 class Order(db.Model):
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        # 订单历史按 (created_at, id) 倒序分页，两个索引使每一页都是一次索引范围扫描，
+        # 已有数据库用 migrations/add_order_history_indexes.py 补建
+        db.Index('ix_order_user_created', 'user_id', 'created_at', 'id'),
+        db.Index('ix_order_user_payment_created', 'user_id', 'payment_status', 'created_at', 'id'),
+        {'extend_existing': True}
+    )
     __tablename__ = 'order'
     id = db.Column(db.Integer, primary_key=True)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
@@ -141,24 +162,59 @@ class GetOrder(db.Model):
     )
 
     
+    @classmethod
+    def query_with_user(cls):
+        """随订单一起联表加载用户，配合 to_dicts 使用时不再单独查询用户"""
+        return cls.query.options(joinedload(cls.user))
+
     def to_dict(self):
-        return {
-            'main_order_id': self.main_order_id,
-            'total_amount': float(self.total_amount),
-            'status': self.status,
+        return self.to_dicts([self])[0]
+
+    @classmethod
+    def to_dicts(cls, orders):
+        """
+        批量序列化订单，查询次数与订单数、商品数无关：
+            一条查询从中间表联表读取全部订单的商品和数量
+            一条查询读取尚未加载的用户（用 query_with_user 查出的订单不再查询）
+        """
+        orders = list(orders)
+        if not orders:
+            return []
+
+        products = {order.id: [] for order in orders}
+        rows = db.session.query(
+            order_products.c.order_id, Product.id, Product.name, Product.price, order_products.c.quantity
+        ).join(Product, Product.id == order_products.c.product_id).filter(
+            order_products.c.order_id.in_(list(products))
+        ).order_by(order_products.c.order_id, order_products.c.product_id).all()
+        for order_id, product_id, name, price, quantity in rows:
+            products[order_id].append({
+                'product_id': product_id,
+                'name': name,
+                'price': float(price),
+                'quantity': quantity
+            })
+
+        users = {}
+        unloaded = {order.user_id for order in orders if 'user' in sa_inspect(order).unloaded}
+        if unloaded:
+            users.update(db.session.query(User.id, User.username).filter(User.id.in_(unloaded)).all())
+        for order in orders:
+            if order.user_id not in unloaded and order.user is not None:
+                users[order.user.id] = order.user.username
+
+        return [{
+            'main_order_id': order.main_order_id,
+            'total_amount': float(order.total_amount),
+            'status': order.status,
             'user': {
-                'user_id': self.user.id,
-                'username': self.user.username
+                'user_id': order.user_id,
+                'username': users.get(order.user_id)
             },
-            'products': [{
-                'product_id': product.id,
-                'name': product.name,
-                'price': float(product.price),
-                'quantity': self.get_product_quantity(product.id)  # 添加数量信息
-            } for product in self.products],
-            'create_time': self.create_time.strftime('%Y-%m-%d %H:%M:%S'),
-            'update_time': self.update_time.strftime('%Y-%m-%d %H:%M:%S')
-        }
+            'products': products[order.id],
+            'create_time': order.create_time.strftime('%Y-%m-%d %H:%M:%S'),
+            'update_time': order.update_time.strftime('%Y-%m-%d %H:%M:%S')
+        } for order in orders]
     
     def get_product_quantity(self, product_id):
         """获取订单中特定产品的数量"""
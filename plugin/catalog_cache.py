@@ -0,0 +1,258 @@
+"""
+商品目录缓存键和商品总数
+
+所有商品列表缓存键都带上目录版本号，商品增删改时递增版本号，
+旧版本的键不再被读取，到期后由Redis自动清理，不需要逐个删除。
+商品总数随新增、删除增量维护，分页时不再执行 COUNT(*)。
+"""
+import logging
+import time
+from config import CACHE_CONFIG
+from utils.redis_util import redis_client
+from plugin.two_tier_cache import TwoTierCache
+
+VERSION_KEY = 'catalog:version'
+COUNT_KEY = 'catalog:product_count'
+
+logger = logging.getLogger(__name__)
+
+# 商品接口共用的两级缓存
+product_cache = TwoTierCache(
+    redis_client,
+    ttl=CACHE_CONFIG['PRODUCT_TTL'],
+    local_size=CACHE_CONFIG['LOCAL_SIZE'],
+    local_ttl=CACHE_CONFIG['LOCAL_TTL'],
+    beta=CACHE_CONFIG['EARLY_REFRESH_BETA'],
+    load_timeout=CACHE_CONFIG['LOAD_TIMEOUT']
+)
+
+_version = {'value': 0, 'expires_at': 0}  # 版本号在进程内缓存 LOCAL_TTL 秒
+
+
+def catalog_version():
+    """当前目录版本号，键不存在或Redis不可用时为0"""
+    if redis_client is None:
+        return 0
+    if _version['expires_at'] > time.time():
+        return _version['value']
+    try:
+        value = int(redis_client.get(VERSION_KEY) or 0)
+    except Exception as e:
+        logger.warning(f"读取商品目录版本号失败: {e}")
+        return _version['value']
+    _version['value'] = value
+    _version['expires_at'] = time.time() + CACHE_CONFIG['LOCAL_TTL']
+    return value
+
+
+def bump_catalog_version(client=None):
+    """
+    商品数据变更后调用，使所有旧版本缓存失效；失败只记录日志，旧缓存最多保留到过期
+    :param client: 传入管道时只把命令加入管道，由调用方统一执行
+    """
+    if client is not None:
+        client.incr(VERSION_KEY)
+        _version['expires_at'] = 0  # 下次读取时重新获取版本号
+        return None
+    if redis_client is None:
+        return None
+    try:
+        value = redis_client.incr(VERSION_KEY)
+    except Exception as e:
+        logger.warning(f"递增商品目录版本号失败: {e}")
+        return None
+    # 本进程立即使用新版本号，其他进程最多延迟 LOCAL_TTL 秒
+    _version['value'] = value
+    _version['expires_at'] = time.time() + CACHE_CONFIG['LOCAL_TTL']
+    return value
+
+
+def catalog_key(version, name, **params):
+    """例如 catalog_key(3, 'page', page=1, limit=10) -> products:v3:page:limit=10:page=1"""
+    parts = [f"products:v{version}", name]
+    parts.extend(f"{key}={params[key]}" for key in sorted(params))
+    return ':'.join(parts)
+
+# 计数键存在时才增减，避免在未初始化的键上得到错误的总数
+_ADJUST_COUNT_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('INCRBY', KEYS[1], ARGV[1])
+end
+return false
+"""
+
+_adjust_count_script = redis_client.register_script(_ADJUST_COUNT_LUA) if redis_client else None
+
+
+def product_count():
+    """
+    商品总数（需要应用上下文）
+    总数保存在Redis中，随新增、删除增量更新；键不存在或Redis不可用时查询数据库
+    """
+    from models import Product
+
+    if redis_client is not None:
+        try:
+            cached = redis_client.get(COUNT_KEY)
+            if cached is not None:
+                return int(cached)
+        except Exception as e:
+            logger.warning(f"读取商品总数失败: {e}")
+            return Product.query.count()
+
+    total = Product.query.count()
+    if redis_client is not None:
+        try:
+            # 并发初始化时只保留第一次写入的值
+            redis_client.set(COUNT_KEY, total, nx=True)
+        except Exception as e:
+            logger.warning(f"写入商品总数失败: {e}")
+    return total
+
+
+def adjust_product_count(delta):
+    """新增商品后传1，删除后传-1；失败时删除计数键，下次读取时从数据库重新统计"""
+    if redis_client is None:
+        return
+    try:
+        _adjust_count_script(keys=[COUNT_KEY], args=[delta])
+    except Exception as e:
+        logger.warning(f"更新商品总数失败: {e}")
+        try:
+            redis_client.delete(COUNT_KEY)
+        except Exception:
+            pass
+
+
+# 单个商品缓存：每个商品一个Redis哈希，库存、价格变更时同步写入
+
+PRODUCT_KEY = 'product:{}'
+
+# 缓存存在时才修改库存，避免生成只有库存字段的残缺缓存
+_ADJUST_STOCK_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('HINCRBY', KEYS[1], 'stock', ARGV[1])
+end
+return false
+"""
+
+_SET_STOCK_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('HSET', KEYS[1], 'stock', ARGV[1])
+end
+return false
+"""
+
+_adjust_stock_script = redis_client.register_script(_ADJUST_STOCK_LUA) if redis_client else None
+_set_stock_script = redis_client.register_script(_SET_STOCK_LUA) if redis_client else None
+
+
+def product_to_dict(product):
+    return {
+        'id': product.id,
+        'name': product.name,
+        'price': product.price,
+        'stock': product.stock
+    }
+
+
+def _from_hash(data):
+    return {
+        'id': int(data[b'id']),
+        'name': data[b'name'].decode('utf-8'),
+        'price': float(data[b'price']),
+        'stock': int(data[b'stock'])
+    }
+
+
+def get_cached_products(product_ids):
+    """
+    按ID批量读取商品（需要应用上下文）
+    一次管道读取全部缓存，未命中的商品用一条IN查询回源并写入缓存
+    :return: {商品ID: 商品字典}，不存在的商品不在结果中
+    """
+    from models import Product
+
+    product_ids = list(dict.fromkeys(int(product_id) for product_id in product_ids))
+    found = {}
+    if redis_client is not None and product_ids:
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            for product_id in product_ids:
+                pipe.hgetall(PRODUCT_KEY.format(product_id))
+            for product_id, data in zip(product_ids, pipe.execute()):
+                if data:
+                    found[product_id] = _from_hash(data)
+        except Exception as e:
+            logger.warning(f"读取商品缓存失败: {e}")
+
+    missing = [product_id for product_id in product_ids if product_id not in found]
+    if missing:
+        loaded = [product_to_dict(product) for product in Product.query.filter(Product.id.in_(missing)).all()]
+        cache_products(loaded)
+        found.update((item['id'], item) for item in loaded)
+    return found
+
+
+def cache_products(items):
+    """整体写入商品缓存，items 为 product_to_dict 的结果列表"""
+    if redis_client is None or not items:
+        return
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for item in items:
+            key = PRODUCT_KEY.format(item['id'])
+            pipe.delete(key)
+            pipe.hset(key, mapping=item)
+            pipe.expire(key, CACHE_CONFIG['ITEM_TTL'])
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"写入商品缓存失败: {e}")
+
+
+def cache_product(product):
+    cache_products([product_to_dict(product)])
+
+
+def evict_products(product_ids):
+    if redis_client is None or not product_ids:
+        return
+    try:
+        redis_client.delete(*[PRODUCT_KEY.format(product_id) for product_id in product_ids])
+    except Exception as e:
+        logger.warning(f"删除商品缓存失败: {e}")
+
+
+def adjust_cached_stock(deltas):
+    """
+    订单提交后同步扣减缓存中的库存，deltas 为 {商品ID: 库存变化量}
+    写入失败时删除对应缓存，下次读取时回源
+    """
+    deltas = {product_id: delta for product_id, delta in deltas.items() if delta}
+    if redis_client is None or not deltas:
+        return
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for product_id, delta in deltas.items():
+            _adjust_stock_script(keys=[PRODUCT_KEY.format(product_id)], args=[delta], client=pipe)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"同步商品库存缓存失败: {e}")
+        evict_products(list(deltas))
+
+
+def set_cached_stock(product_id, stock, client=None):
+    """
+    库存被直接设置（管理员修改、分片汇总）后同步缓存
+    :param client: 传入管道时只把命令加入管道，由调用方统一执行
+    """
+    if client is not None:
+        _set_stock_script(keys=[PRODUCT_KEY.format(product_id)], args=[stock], client=client)
+        return
+    if redis_client is None:
+        return
+    try:
+        _set_stock_script(keys=[PRODUCT_KEY.format(product_id)], args=[stock])
+    except Exception as e:
+        logger.warning(f"同步商品库存缓存失败: {e}")
+        evict_products([product_id])
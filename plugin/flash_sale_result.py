@@ -0,0 +1,79 @@
+import json
+import time
+import uuid
+import logging
+from threading import Condition
+from utils.redis_util import redis_client
+from config import FLASH_SALE_CONFIG
+
+RESULT_KEY = 'flash_sale:result:{}'
+RESULT_PENDING = 'pending'
+
+logger = logging.getLogger(__name__)
+
+# Redis不可用时的进程内结果存储：ticket -> (结果, 过期时间)
+_local_results = {}
+_local_condition = Condition()
+
+
+def new_ticket():
+    """生成抢购凭证号"""
+    return uuid.uuid4().hex
+
+
+def save_result(ticket, status, **extra):
+    """
+    写入抢购结果，优先写Redis，失败时写进程内存储
+    :param ticket: 抢购凭证号
+    :param status: pending 或 services.flash_sale_service 中的 SETTLE_* 结果
+    """
+    if not ticket:
+        return
+    ttl = FLASH_SALE_CONFIG['RESULT_TTL']
+    payload = dict(extra, status=status)
+    if redis_client is not None:
+        try:
+            redis_client.set(RESULT_KEY.format(ticket), json.dumps(payload), ex=ttl)
+            return
+        except Exception as e:
+            logger.warning(f"写入抢购结果到Redis失败: {e}")
+
+    with _local_condition:
+        now = time.time()
+        for expired in [key for key, (_, expire_at) in _local_results.items() if expire_at < now]:
+            del _local_results[expired]
+        _local_results[ticket] = (payload, now + ttl)
+        _local_condition.notify_all()
+
+
+def get_result(ticket, wait=0):
+    """
+    读取抢购结果，不存在时返回None
+    :param wait: 结果仍为pending时最多等待的秒数（长轮询）
+    """
+    deadline = time.time() + wait
+    while True:
+        result = _read(ticket)
+        remaining = deadline - time.time()
+        if result is None or result['status'] != RESULT_PENDING or remaining <= 0:
+            return result
+        if _local_results.get(ticket) is not None:
+            with _local_condition:
+                _local_condition.wait(remaining)
+        else:
+            time.sleep(min(0.1, remaining))
+
+
+def _read(ticket):
+    if redis_client is not None:
+        try:
+            value = redis_client.get(RESULT_KEY.format(ticket))
+            if value is not None:
+                return json.loads(value)
+        except Exception as e:
+            logger.warning(f"读取Redis抢购结果失败: {e}")
+
+    entry = _local_results.get(ticket)
+    if entry and entry[1] >= time.time():
+        return entry[0]
+    return None
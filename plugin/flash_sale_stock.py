@@ -0,0 +1,146 @@
+import logging
+from utils.redis_util import redis_client
+from config import FLASH_SALE_CONFIG
+from plugin.product_filter import mark_in_stock, update_stock_state
+
+STOCK_KEY = 'flash_sale:stock:{}'  # 商品剩余可售库存
+BOUGHT_KEY = 'flash_sale:bought:{}'  # 商品下各用户已抢购数量（hash）
+
+# 预扣结果
+RESERVE_OK = 1
+RESERVE_SOLD_OUT = 0
+RESERVE_NOT_LOADED = -1
+RESERVE_LIMIT_EXCEEDED = -2
+RESERVE_INSUFFICIENT = -3  # 仍有库存但不足本次购买数量
+
+# 一次往返内完成：库存是否加载、限购校验、库存校验、扣减库存、记录用户购买量
+# KEYS[1]=库存键 KEYS[2]=用户购买量键  ARGV[1]=user_id ARGV[2]=数量 ARGV[3]=限购数量
+_RESERVE_LUA = """
+local stock = redis.call('GET', KEYS[1])
+if not stock then
+    return -1
+end
+local quantity = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+if limit > 0 then
+    local bought = tonumber(redis.call('HGET', KEYS[2], ARGV[1]) or '0')
+    if bought + quantity > limit then
+        return -2
+    end
+end
+if tonumber(stock) <= 0 then
+    return 0
+end
+if tonumber(stock) < quantity then
+    return -3
+end
+redis.call('DECRBY', KEYS[1], quantity)
+redis.call('HINCRBY', KEYS[2], ARGV[1], quantity)
+local ttl = redis.call('TTL', KEYS[1])
+if ttl > 0 then
+    redis.call('EXPIRE', KEYS[2], ttl)
+end
+return 1
+"""
+
+# 归还预扣的库存（订单最终失败时调用）
+_RELEASE_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('INCRBY', KEYS[1], ARGV[2])
+end
+local bought = tonumber(redis.call('HINCRBY', KEYS[2], ARGV[1], -tonumber(ARGV[2])))
+if bought <= 0 then
+    redis.call('HDEL', KEYS[2], ARGV[1])
+end
+return 1
+"""
+
+# 库存已加载时才调整，未加载的商品下次请求时从数据库懒加载
+_ADJUST_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('INCRBY', KEYS[1], ARGV[1])
+end
+return false
+"""
+
+logger = logging.getLogger(__name__)
+
+_reserve_script = redis_client.register_script(_RESERVE_LUA) if redis_client else None
+_release_script = redis_client.register_script(_RELEASE_LUA) if redis_client else None
+_adjust_script = redis_client.register_script(_ADJUST_LUA) if redis_client else None
+
+
+def stock_gate_enabled():
+    """是否启用Redis库存预扣"""
+    return bool(FLASH_SALE_CONFIG.get('STOCK_GATE')) and redis_client is not None
+
+
+def load_stock(product_id, stock, only_if_missing=False):
+    """
+    将商品库存加载到Redis
+    :param product_id: 商品ID
+    :param stock: 库存数量
+    :param only_if_missing: 为True时仅在键不存在时写入，用于请求路径上的懒加载
+    """
+    ttl = FLASH_SALE_CONFIG.get('STOCK_TTL') or None
+    stock_key = STOCK_KEY.format(product_id)
+    if only_if_missing:
+        loaded = bool(redis_client.set(stock_key, stock, ex=ttl, nx=True))
+        if loaded:
+            update_stock_state(product_id, stock)
+        return loaded
+
+    # 重新开售时同时清空用户购买记录
+    pipe = redis_client.pipeline()
+    pipe.set(stock_key, stock, ex=ttl)
+    pipe.delete(BOUGHT_KEY.format(product_id))
+    pipe.execute()
+    update_stock_state(product_id, stock)
+    return True
+
+
+def peek_stock(product_id):
+    """读取Redis中的剩余库存，未加载或已过期时返回None"""
+    stock = redis_client.get(STOCK_KEY.format(product_id))
+    return None if stock is None else int(stock)
+
+
+def reserve_stock(product_id, user_id, quantity):
+    """原子预扣库存，返回 RESERVE_* 之一"""
+    keys = [STOCK_KEY.format(product_id), BOUGHT_KEY.format(product_id)]
+    args = [user_id, quantity, FLASH_SALE_CONFIG.get('USER_LIMIT', 0)]
+    return int(_reserve_script(keys=keys, args=args))
+
+
+def release_stock(product_id, user_id, quantity):
+    """归还预扣的库存，失败只记录日志，不影响调用方"""
+    if redis_client is None:
+        return
+    try:
+        keys = [STOCK_KEY.format(product_id), BOUGHT_KEY.format(product_id)]
+        _release_script(keys=keys, args=[user_id, quantity])
+    except Exception as e:
+        logger.warning(f"归还Redis预扣库存失败: {e}")
+        return
+    mark_in_stock(product_id)
+
+
+def adjust_stock(product_id, delta, client):
+    """数据库库存增减后同步调整已加载的Redis库存，命令加入调用方的管道"""
+    _adjust_script(keys=[STOCK_KEY.format(product_id)], args=[delta], client=client)
+
+
+def invalidate_stock(product_id, client=None):
+    """
+    数据库库存被直接设置后删除Redis库存，下次请求时重新加载；失败只记录日志，库存键最多保留到过期
+    :param client: 传入管道时只把命令加入管道，由调用方统一执行
+    """
+    if client is not None:
+        client.delete(STOCK_KEY.format(product_id))
+        return
+    if redis_client is None:
+        return
+    try:
+        redis_client.delete(STOCK_KEY.format(product_id))
+    except Exception as e:
+        logger.warning(f"删除Redis预扣库存失败: {e}")
@@ -0,0 +1,228 @@
+"""
+Snowflake风格的分布式ID生成器
+
+64位ID = 1位符号位(0) + 41位毫秒时间戳 + 10位节点号 + 12位序列号
+    生成ID时不访问数据库和Redis；同一节点每毫秒最多4096个，整体按时间递增
+    每个进程使用不同的节点号即不会重复，节点号按以下方式分配（见 ID_GENERATOR_CONFIG）：
+        设置了环境变量时直接使用，由部署方保证每个进程不同（例如基础值加worker序号）
+        未设置时在首次生成ID时从Redis租用一个空闲节点号，后台线程定期续期；续期失败或租约过期后不再用旧节点号生成，
+        下次生成时重新租用；两种方式都不可用时抛出 IdGeneratorError，不使用可能重复的默认值
+    fork 出的子进程重新分配节点号并重置状态，不沿用父进程的节点号和序列
+    时钟回拨时继续使用上次的时间戳，序列号用完后借用下一毫秒，保证ID不重复且单调递增
+主订单号使用 Crockford Base32 定长编码（13个字符，只含数字和大写字母），
+字符串顺序与数值顺序一致，大小写不敏感的排序规则下也不会冲突，主订单号索引只在末尾追加。
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from config import ID_GENERATOR_CONFIG
+
+TIMESTAMP_BITS = 41
+NODE_BITS = 10
+SEQUENCE_BITS = 12
+MAX_NODE_ID = (1 << NODE_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'  # Crockford Base32，按ASCII升序
+ENCODED_LENGTH = 13  # ceil(64 / 5)
+
+logger = logging.getLogger(__name__)
+
+
+class IdGenerator:
+    def __init__(self, node_id, epoch_ms=None):
+        if not 0 <= node_id <= MAX_NODE_ID:
+            raise ValueError(f"节点号应在0-{MAX_NODE_ID}之间: {node_id}")
+        self.node_id = node_id
+        self.epoch_ms = ID_GENERATOR_CONFIG['EPOCH_MS'] if epoch_ms is None else epoch_ms
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._sequence = 0
+
+    def next_id(self):
+        with self._lock:
+            now = int(time.time() * 1000) - self.epoch_ms
+            if now > self._last_ms:
+                self._last_ms = now
+                self._sequence = 0
+            else:
+                if now < self._last_ms - 1000:
+                    logger.warning(f"检测到时钟回拨 {self._last_ms - now}ms，继续使用上次的时间戳生成ID")
+                self._sequence += 1
+                if self._sequence > MAX_SEQUENCE:
+                    # 当前毫秒序列号用完（或时钟回拨期间），借用下一毫秒
+                    self._last_ms += 1
+                    self._sequence = 0
+            if self._last_ms >= 1 << TIMESTAMP_BITS:
+                raise OverflowError("ID时间戳超出41位范围，请检查 EPOCH_MS 配置")
+            return (self._last_ms << (NODE_BITS + SEQUENCE_BITS)) | (self.node_id << SEQUENCE_BITS) | self._sequence
+
+    def parse(self, value):
+        """ID -> (生成时间的毫秒时间戳, 节点号, 序列号)，用于排查问题"""
+        return (
+            (value >> (NODE_BITS + SEQUENCE_BITS)) + self.epoch_ms,
+            (value >> SEQUENCE_BITS) & MAX_NODE_ID,
+            value & MAX_SEQUENCE
+        )
+
+
+def encode_id(value):
+    """64位ID -> 13位定长Base32字符串"""
+    chars = []
+    for _ in range(ENCODED_LENGTH):
+        value, remainder = divmod(value, 32)
+        chars.append(ALPHABET[remainder])
+    return ''.join(reversed(chars))
+
+
+def decode_id(text):
+    value = 0
+    for char in text.upper():
+        value = value * 32 + ALPHABET.index(char)
+    return value
+
+
+class IdGeneratorError(Exception):
+    """无法为当前进程分配唯一的节点号"""
+
+
+NODE_LEASE_KEY = 'id_generator:node:'  # 加节点号，值为租用者的随机令牌
+NODE_CURSOR_KEY = 'id_generator:node_cursor'  # 轮转起点，避免每次都从0号开始尝试
+
+# 从轮转起点开始找第一个空闲节点号并租用
+# KEYS[1]=轮转起点  ARGV[1]=租约键前缀 ARGV[2]=令牌 ARGV[3]=节点号总数 ARGV[4]=租约秒数
+_ACQUIRE_LUA = """
+local start = redis.call('INCR', KEYS[1])
+local total = tonumber(ARGV[3])
+for i = 0, total - 1 do
+    local node = (start + i) % total
+    if redis.call('SET', ARGV[1] .. node, ARGV[2], 'NX', 'EX', ARGV[4]) then
+        return node
+    end
+end
+return -1
+"""
+
+# 租约仍属于自己时续期
+_RENEW_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+class NodeLease:
+    """Redis中的节点号租约；本地按单调时钟判断有效期，有效期比Redis中的TTL短1/3，留出续期余量"""
+
+    def __init__(self, client, ttl):
+        self.client = client
+        self.ttl = ttl
+        self.token = uuid.uuid4().hex
+        self.node_id = None
+        self._valid_until = 0
+
+    def acquire(self):
+        started = time.monotonic()
+        node_id = int(self.client.eval(
+            _ACQUIRE_LUA, 1, NODE_CURSOR_KEY, NODE_LEASE_KEY, self.token, MAX_NODE_ID + 1, self.ttl
+        ))
+        if node_id < 0:
+            raise IdGeneratorError("Redis中没有空闲的节点号")
+        self.node_id = node_id
+        self._valid_until = started + self.ttl * 2 / 3
+        return node_id
+
+    def renew(self):
+        started = time.monotonic()
+        try:
+            renewed = self.client.eval(_RENEW_LUA, 1, NODE_LEASE_KEY + str(self.node_id), self.token, self.ttl)
+        except Exception as e:
+            logger.warning(f"节点号 {self.node_id} 续期失败: {e}")
+            return self.valid()
+        if not renewed:
+            logger.warning(f"节点号 {self.node_id} 的租约已失效，将重新租用")
+            self._valid_until = 0
+            return False
+        self._valid_until = started + self.ttl * 2 / 3
+        return True
+
+    def valid(self):
+        return time.monotonic() < self._valid_until
+
+
+def configured_node_id():
+    """环境变量中的节点号，未设置时返回None"""
+    value = os.environ.get(ID_GENERATOR_CONFIG['NODE_ID_ENV'])
+    return int(value) if value not in (None, '') else None
+
+
+_state = {'generator': None, 'lease': None, 'pid': None}
+_generator_lock = threading.Lock()
+
+
+def get_generator():
+    """当前进程的ID生成器，首次使用、fork 后或租约失效后重新分配节点号"""
+    if _usable():
+        return _state['generator']
+    with _generator_lock:
+        if _usable():
+            return _state['generator']
+        lease = _state['lease']
+        if lease is not None and _state['pid'] == os.getpid() and lease.renew():
+            return _state['generator']
+
+        node_id = configured_node_id()
+        lease = None
+        if node_id is None:
+            from utils.redis_util import redis_client
+
+            if redis_client is None:
+                raise IdGeneratorError(
+                    f"未设置环境变量 {ID_GENERATOR_CONFIG['NODE_ID_ENV']} 且Redis不可用，无法分配唯一的节点号"
+                )
+            lease = NodeLease(redis_client, ID_GENERATOR_CONFIG['NODE_LEASE_TTL'])
+            node_id = lease.acquire()
+            print(f"已租用订单号节点号: {node_id}")
+        _state.update(generator=IdGenerator(node_id), lease=lease, pid=os.getpid())
+        if lease is not None:
+            _start_renewer(lease)
+        return _state['generator']
+
+
+def _usable():
+    if _state['generator'] is None or _state['pid'] != os.getpid():
+        return False
+    return _state['lease'] is None or _state['lease'].valid()
+
+
+def _start_renewer(lease):
+    """后台定期续期；租约被替换（重新租用或 fork 后）时线程退出"""
+    pid = os.getpid()
+
+    def run():
+        while True:
+            time.sleep(lease.ttl / 3)
+            if _state['lease'] is not lease or os.getpid() != pid:
+                return
+            with _generator_lock:
+                if _state['lease'] is lease:
+                    lease.renew()
+
+    threading.Thread(target=run, name='id-node-lease', daemon=True).start()
+
+
+def next_id():
+    return get_generator().next_id()
+
+
+def new_order_id():
+    """生成主订单号"""
+    return encode_id(next_id())
+
+
+if hasattr(os, 'register_at_fork'):
+    # 子进程中重新创建锁，避免 fork 时父进程其他线程持有锁导致死锁
+    os.register_at_fork(after_in_child=lambda: globals().update(_generator_lock=threading.Lock()))
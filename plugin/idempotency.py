@@ -0,0 +1,76 @@
+"""
+基于Redis的幂等键
+
+客户端在请求头 Idempotency-Key 中携带唯一键，同一用户同一键的请求只执行一次：
+    首次请求占用键（SET NX，状态为处理中），处理完成后保存响应
+    重复请求直接返回保存的响应；仍在处理中时返回 IDEMPOTENCY_PENDING
+    同一个键用于不同的请求内容时返回 IDEMPOTENCY_MISMATCH
+Redis不可用时不做幂等检查，由业务自身的条件更新保证不会重复扣款。
+"""
+import logging
+from config import PAYMENT_CONFIG
+from utils.redis_util import redis_client
+from utils.cache_serializer import dumps, loads
+
+IDEMPOTENCY_KEY = 'idempotency:{}:{}:{}'  # 业务范围、用户ID、客户端传入的键
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+KEY_MAX_LENGTH = 128
+
+# begin 的返回状态
+IDEMPOTENCY_NEW = 'new'  # 首次请求，已占用键，处理完成后调用 finish
+IDEMPOTENCY_DONE = 'done'  # 重复请求，返回保存的响应
+IDEMPOTENCY_PENDING = 'pending'  # 同一键的请求仍在处理中
+IDEMPOTENCY_MISMATCH = 'mismatch'  # 同一键对应的请求内容不同
+
+logger = logging.getLogger(__name__)
+
+
+def begin(scope, user_id, key, fingerprint):
+    """
+    占用幂等键
+    :param fingerprint: 请求内容摘要，例如主订单号
+    :return: (状态, 保存的响应 (状态码, 响应体) 或 None)
+    """
+    if redis_client is None:
+        return IDEMPOTENCY_NEW, None
+    redis_key = IDEMPOTENCY_KEY.format(scope, user_id, key)
+    try:
+        pending = dumps({'fingerprint': fingerprint, 'status': IDEMPOTENCY_PENDING})
+        if redis_client.set(redis_key, pending, nx=True, ex=PAYMENT_CONFIG['PENDING_TTL']):
+            return IDEMPOTENCY_NEW, None
+        value = redis_client.get(redis_key)
+    except Exception as e:
+        logger.warning(f"读取幂等键失败: {e}")
+        return IDEMPOTENCY_NEW, None
+
+    if value is None:  # 处理中状态恰好过期，按首次请求重新占用
+        return begin(scope, user_id, key, fingerprint)
+    record = loads(value)
+    if record['fingerprint'] != fingerprint:
+        return IDEMPOTENCY_MISMATCH, None
+    if record['status'] == IDEMPOTENCY_PENDING:
+        return IDEMPOTENCY_PENDING, None
+    return IDEMPOTENCY_DONE, (record['code'], record['body'])
+
+
+def finish(scope, user_id, key, fingerprint, code, body):
+    """保存处理结果，之后的重复请求直接返回该结果"""
+    if redis_client is None:
+        return
+    record = {'fingerprint': fingerprint, 'status': IDEMPOTENCY_DONE, 'code': code, 'body': body}
+    try:
+        redis_client.set(
+            IDEMPOTENCY_KEY.format(scope, user_id, key), dumps(record), ex=PAYMENT_CONFIG['IDEMPOTENCY_TTL']
+        )
+    except Exception as e:
+        logger.warning(f"保存幂等结果失败: {e}")
+
+
+def release(scope, user_id, key):
+    """处理异常时释放幂等键，允许客户端用同一个键重试"""
+    if redis_client is None:
+        return
+    try:
+        redis_client.delete(IDEMPOTENCY_KEY.format(scope, user_id, key))
+    except Exception as e:
+        logger.warning(f"释放幂等键失败: {e}")
@@ -0,0 +1,439 @@
+import os
+import json
+import socket
+import threading
+import time
+import uuid
+import logging
+from abc import ABC, abstractmethod
+from queue import Queue, Empty, Full
+from threading import Lock
+import pika
+import redis
+from plugin.rabbitmq_publisher import RabbitMQPublisher, PublishError
+
+logger = logging.getLogger(__name__)
+
+
+class BrokerError(Exception):
+    """消息代理不可用或发布失败，调用方应走降级逻辑"""
+
+
+class Delivery:
+    """消费到的一条消息，tag 由具体后端用于确认"""
+
+    def __init__(self, body, tag=None, headers=None):
+        self.body = body
+        self.tag = tag
+        self.headers = headers or {}
+
+
+def dead_letter_queue(queue):
+    """队列对应的死信队列名"""
+    return f"{queue}.dead"
+
+
+class MessageBroker(ABC):
+    """
+    消息代理接口，具体后端必须实现全部抽象方法，缺少实现时在创建实例时即报错
+    publish 由请求线程并发调用；consumer() 为每个消费线程创建独立的消费者，消费者只在创建它的线程中使用
+    """
+    name = None
+
+    def available(self):
+        return True
+
+    @abstractmethod
+    def publish(self, queue, body, headers=None, delay=0):
+        """
+        发布消息
+        :param headers: 消息头，消费时通过 Delivery.headers 读取
+        :param delay: 延迟投递的秒数，用于失败重试
+        """
+
+    @abstractmethod
+    def consumer(self, queue, prefetch, name=None):
+        """
+        :param name: 稳定的消费者名（例如主机名加消费进程序号），重启后沿用同一个名字；None 表示自动生成
+        """
+
+    @abstractmethod
+    def queue_depth(self, queue):
+        """队列积压的消息数"""
+
+    def stats(self):
+        return {'backend': self.name}
+
+
+class BrokerConsumer(ABC):
+    @abstractmethod
+    def fetch(self, max_count, timeout):
+        """最多取 max_count 条消息，最多等待 timeout 秒，没有消息时返回空列表"""
+
+    def ack(self, delivery):
+        pass
+
+    @abstractmethod
+    def nack(self, delivery, requeue=False):
+        """拒绝消息，requeue 为True时重新入队"""
+
+    def close(self):
+        pass
+
+
+def amqp_parameters(config):
+    """RabbitMQ连接参数"""
+    return pika.ConnectionParameters(
+        host=config['HOST'],
+        port=config['PORT'],
+        virtual_host=config['VIRTUAL_HOST'],
+        credentials=pika.PlainCredentials(config['USERNAME'], config['PASSWORD']),
+        heartbeat=config['HEARTBEAT'],
+        blocked_connection_timeout=config['BLOCKED_CONNECTION_TIMEOUT'],
+        connection_attempts=3,  # Retry connection 3 times
+        retry_delay=5,  # Wait 5 seconds between retries
+        socket_timeout=10,  # Socket operation timeout
+        stack_timeout=10,  # Protocol negotiation timeout
+        frame_max=131072  # Increase max frame size to prevent frame_too_large errors
+    )
+
+
+class AMQPBroker(MessageBroker):
+    """
+    RabbitMQ：发布走通道池，每个消费者独占一条连接
+    延迟投递使用带TTL的重试队列 <队列名>.retry.<秒数>，消息过期后经默认交换机回到原队列
+    """
+    name = 'amqp'
+
+    def __init__(self, config, queues=None, retry_delays=()):
+        self.config = config
+        self.retry_delays = sorted(set(retry_delays))
+        queues = queues or [config['QUEUE_NAME']]
+        declarations = {}
+        for queue in queues:
+            declarations[queue] = None
+            declarations[dead_letter_queue(queue)] = None
+            for delay in self.retry_delays:
+                declarations[self._retry_queue(queue, delay)] = {
+                    'x-message-ttl': int(delay * 1000),
+                    'x-dead-letter-exchange': '',
+                    'x-dead-letter-routing-key': queue
+                }
+        self.publisher = RabbitMQPublisher(
+            config,
+            pool_size=config['PUBLISHER_POOL_SIZE'],
+            checkout_timeout=config['PUBLISHER_CHECKOUT_TIMEOUT'],
+            reconnect_interval=config['PUBLISHER_RECONNECT_INTERVAL'],
+            queues=declarations
+        )
+
+    @staticmethod
+    def _retry_queue(queue, delay):
+        return f"{queue}.retry.{delay}s"
+
+    def available(self):
+        return self.publisher.available()
+
+    def publish(self, queue, body, headers=None, delay=0):
+        routing_key = queue
+        if delay > 0:
+            if not self.retry_delays:
+                raise BrokerError("未配置重试队列，无法延迟投递")
+            # 取不小于delay的最短重试队列
+            delay = next((item for item in self.retry_delays if item >= delay), self.retry_delays[-1])
+            routing_key = self._retry_queue(queue, delay)
+        try:
+            self.publisher.publish(routing_key, body, headers=headers)
+        except PublishError as e:
+            raise BrokerError(str(e))
+
+    def consumer(self, queue, prefetch, name=None):
+        return AMQPConsumer(self.config, queue, prefetch)
+
+    def queue_depth(self, queue):
+        try:
+            return self.publisher.queue_depth(queue)
+        except PublishError as e:
+            raise BrokerError(str(e))
+
+    def stats(self):
+        return dict(self.publisher.stats(), backend=self.name)
+
+
+class AMQPConsumer(BrokerConsumer):
+    def __init__(self, config, queue, prefetch):
+        self.connection = pika.BlockingConnection(amqp_parameters(config))
+        self.channel = self.connection.channel()
+        self.channel.queue_declare(queue=queue, durable=True)
+        self.channel.basic_qos(prefetch_count=prefetch)
+        self._messages = self.channel.consume(queue=queue, auto_ack=False, inactivity_timeout=0.05)
+
+    def fetch(self, max_count, timeout):
+        deliveries = []
+        deadline = time.time() + timeout
+        for method, properties, body in self._messages:
+            if method is not None:
+                deliveries.append(Delivery(body, method.delivery_tag, properties.headers))
+            if len(deliveries) >= max_count or time.time() >= deadline:
+                break
+        return deliveries
+
+    def ack(self, delivery):
+        self.channel.basic_ack(delivery_tag=delivery.tag)
+
+    def nack(self, delivery, requeue=False):
+        self.channel.basic_nack(delivery_tag=delivery.tag, requeue=requeue)
+
+    def close(self):
+        try:
+            self.connection.close()
+        except Exception:
+            pass
+
+
+# 把到期的延迟消息移回Stream
+# KEYS[1]=延迟消息有序集合 KEYS[2]=Stream  ARGV[1]=当前时间 ARGV[2]=单次最多移动条数
+_PROMOTE_LUA = """
+local items = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+for _, item in ipairs(items) do
+    local message = cjson.decode(item)
+    redis.call('XADD', KEYS[2], '*', 'body', message.body, 'headers', message.headers)
+    redis.call('ZREM', KEYS[1], item)
+end
+return #items
+"""
+
+
+class RedisStreamBroker(MessageBroker):
+    """
+    Redis Streams：XADD发布，消费者组 XREADGROUP 消费
+    延迟消息先放入有序集合 <Stream>:delayed，消费者拉取前把到期的消息移回Stream
+    已取到但未确认的消息（处理时异常、进程退出）空闲超过 claim_idle 秒后由组内其他消费者 XAUTOCLAIM 认领重新处理
+    Stream不按长度裁剪（裁剪会丢弃尚未消费的订单），消息确认时 XACK+XDEL 删除；
+    进入Stream的订单已在Redis预扣库存，积压量不超过已加载的秒杀库存
+    """
+    name = 'redis'
+
+    def __init__(self, client, group, claim_idle=60, claim_interval=30):
+        self.client = client
+        self.group = group
+        self.claim_idle = claim_idle
+        self.claim_interval = claim_interval
+        self._promote_script = client.register_script(_PROMOTE_LUA)
+
+    def publish(self, queue, body, headers=None, delay=0):
+        if isinstance(body, bytes):
+            body = body.decode('utf-8')
+        encoded_headers = json.dumps(headers or {})
+        try:
+            if delay > 0:
+                member = json.dumps({'id': uuid.uuid4().hex, 'body': body, 'headers': encoded_headers})
+                self.client.zadd(f"{queue}:delayed", {member: time.time() + delay})
+            else:
+                self.client.xadd(queue, {'body': body, 'headers': encoded_headers})
+        except redis.exceptions.RedisError as e:
+            raise BrokerError(f"Redis Stream发布失败: {e}")
+
+    def consumer(self, queue, prefetch, name=None):
+        return RedisStreamConsumer(
+            self.client, queue, self.group, self._promote_script,
+            name=name, claim_idle=self.claim_idle, claim_interval=self.claim_interval
+        )
+
+    def queue_depth(self, queue):
+        # 消息确认后即XDEL，Stream长度就是未确认和未投递的消息数
+        try:
+            return self.client.xlen(queue)
+        except redis.exceptions.RedisError as e:
+            raise BrokerError(f"查询Stream长度失败: {e}")
+
+    def stats(self):
+        return {'backend': self.name, 'group': self.group}
+
+
+class RedisStreamConsumer(BrokerConsumer):
+    def __init__(self, client, stream, group, promote_script, name=None, claim_idle=60, claim_interval=30):
+        self.client = client
+        self.stream = stream
+        self.group = group
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}-{threading.get_ident()}"
+        self._promote_script = promote_script
+        self._claim_idle_ms = int(claim_idle * 1000)
+        self._claim_interval = claim_interval
+        self._next_claim = 0  # 启动后第一次拉取时立即认领
+        self._own_pending = name is not None  # 稳定名字的消费者重启后先重新读取自己名下未确认的消息
+        try:
+            client.xgroup_create(stream, group, id='0', mkstream=True)
+        except redis.exceptions.ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    def fetch(self, max_count, timeout):
+        self._promote_script(keys=[f"{self.stream}:delayed", self.stream], args=[time.time(), max_count])
+        deliveries = self._recover(max_count)
+        if deliveries:
+            return deliveries
+        response = self.client.xreadgroup(
+            self.group, self.name, {self.stream: '>'},
+            count=max_count, block=max(int(timeout * 1000), 1)
+        )
+        return self._deliveries([entry for _, entries in response or [] for entry in entries])
+
+    def _recover(self, max_count):
+        """重新投递未确认的消息：先读取自己名下的，再定期认领组内空闲超时的"""
+        if self._own_pending:
+            response = self.client.xreadgroup(self.group, self.name, {self.stream: '0'}, count=max_count)
+            entries = [entry for _, items in response or [] for entry in items]
+            if entries:
+                return self._deliveries(entries)
+            self._own_pending = False
+
+        if time.time() < self._next_claim:
+            return []
+        self._next_claim = time.time() + self._claim_interval
+        # XAUTOCLAIM <stream> <group> <consumer> <min-idle-time> 0-0 COUNT n
+        _, entries = self.client.xautoclaim(
+            self.stream, self.group, self.name, self._claim_idle_ms, start_id='0-0', count=max_count
+        )[:2]
+        if entries:
+            print(f"认领 {self.stream} 中 {len(entries)} 条空闲超时的未确认消息")
+            self._next_claim = 0  # 可能还有更多，下次拉取时继续认领
+            return self._deliveries(entries)
+        self._remove_idle_consumers()
+        return []
+
+    def _remove_idle_consumers(self):
+        """删除没有未确认消息且长时间空闲的消费者（已退出进程遗留的名字），消费者再次读取时会自动重建"""
+        try:
+            for consumer in self.client.xinfo_consumers(self.stream, self.group):
+                name = consumer['name']
+                if isinstance(name, bytes):
+                    name = name.decode('utf-8')
+                if name != self.name and not consumer['pending'] and consumer['idle'] > self._claim_idle_ms:
+                    self.client.xgroup_delconsumer(self.stream, self.group, name)
+        except redis.exceptions.RedisError as e:
+            logger.warning(f"清理空闲消费者失败: {e}")
+
+    def _deliveries(self, entries):
+        deliveries = []
+        stale = []
+        for entry_id, fields in entries:
+            if entry_id is None:
+                continue
+            if not fields:
+                stale.append(entry_id)  # 消息已被删除，只剩待确认记录
+                continue
+            headers = json.loads(fields.get(b'headers') or b'{}')
+            deliveries.append(Delivery(fields.get(b'body'), entry_id, headers))
+        if stale:
+            self.client.xack(self.stream, self.group, *stale)
+        return deliveries
+
+    def ack(self, delivery):
+        pipe = self.client.pipeline()
+        pipe.xack(self.stream, self.group, delivery.tag)
+        pipe.xdel(self.stream, delivery.tag)
+        pipe.execute()
+
+    def nack(self, delivery, requeue=False):
+        pipe = self.client.pipeline()
+        if requeue:
+            pipe.xadd(self.stream, {'body': delivery.body, 'headers': json.dumps(delivery.headers)})
+        pipe.xack(self.stream, self.group, delivery.tag)
+        pipe.xdel(self.stream, delivery.tag)
+        pipe.execute()
+
+
+class InProcessBroker(MessageBroker):
+    """进程内有界队列，由本进程的消费线程池处理，不依赖外部服务"""
+    name = 'memory'
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._queues = {}
+        self._lock = Lock()
+
+    def _queue(self, name):
+        with self._lock:
+            if name not in self._queues:
+                self._queues[name] = Queue(self.maxsize)
+            return self._queues[name]
+
+    def publish(self, queue, body, headers=None, delay=0):
+        if delay > 0:
+            timer = threading.Timer(delay, self._put_delayed, args=(queue, body, headers))
+            timer.daemon = True
+            timer.start()
+            return
+        try:
+            self._queue(queue).put_nowait((body, headers))
+        except Full:
+            raise BrokerError("进程内消息队列已满")
+
+    def _put_delayed(self, queue, body, headers):
+        try:
+            self._queue(queue).put_nowait((body, headers))
+        except Full:
+            logger.warning("进程内消息队列已满，丢弃延迟重试的消息")
+
+    def consumer(self, queue, prefetch, name=None):
+        return InProcessConsumer(self._queue(queue))
+
+    def queue_depth(self, queue):
+        return self._queue(queue).qsize()
+
+    def stats(self):
+        with self._lock:
+            queued = {name: queue.qsize() for name, queue in self._queues.items()}
+        return {'backend': self.name, 'maxsize': self.maxsize, 'queued': queued}
+
+
+class InProcessConsumer(BrokerConsumer):
+    def __init__(self, queue):
+        self.queue = queue
+
+    def fetch(self, max_count, timeout):
+        try:
+            body, headers = self.queue.get(timeout=timeout)
+        except Empty:
+            return []
+        deliveries = [Delivery(body, headers=headers)]
+        while len(deliveries) < max_count:
+            try:
+                body, headers = self.queue.get_nowait()
+            except Empty:
+                break
+            deliveries.append(Delivery(body, headers=headers))
+        return deliveries
+
+    def nack(self, delivery, requeue=False):
+        if requeue:
+            try:
+                self.queue.put_nowait((delivery.body, delivery.headers))
+            except Full:
+                logger.warning("进程内消息队列已满，丢弃重新入队的消息")
+
+
+def create_broker(config, rabbitmq_config, redis_client, queues=None):
+    """
+    按配置创建消息代理，不可用时返回None，调用方走直接处理模式
+    :param config: MESSAGE_BROKER_CONFIG
+    :param queues: 需要预先声明的队列，amqp后端发布前必须声明（含对应的重试队列和死信队列）
+    """
+    backend = config['BACKEND']
+    try:
+        if backend == 'amqp':
+            return AMQPBroker(rabbitmq_config, queues, config['RETRY_DELAYS'])
+        if backend == 'redis':
+            if redis_client is None:
+                raise BrokerError("Redis不可用")
+            return RedisStreamBroker(
+                redis_client, config['REDIS_GROUP'],
+                claim_idle=config['REDIS_CLAIM_IDLE'], claim_interval=config['REDIS_CLAIM_INTERVAL']
+            )
+        if backend == 'memory':
+            return InProcessBroker(config['MEMORY_QUEUE_SIZE'])
+    except Exception as e:
+        print(f"消息代理 {backend} 初始化失败: {e}, 将使用直接处理模式")
+        return None
+    raise ValueError(f"未知的消息代理类型: {backend}")
@@ -0,0 +1,50 @@
+"""
+订单详情缓存
+
+按主订单号缓存订单详情，订单支付或状态变更后调用 invalidate_order 删除；
+缓存值格式见 utils.cache_serializer。
+"""
+import logging
+from config import CACHE_CONFIG
+from utils.redis_util import redis_client
+from utils.cache_serializer import encode, decode
+
+ORDER_KEY = 'order:detail:{}'
+
+logger = logging.getLogger(__name__)
+
+
+def get_cached_order(main_order_id):
+    """读取订单详情缓存，未命中或Redis不可用时返回None"""
+    if redis_client is None:
+        return None
+    try:
+        return decode(redis_client.get(ORDER_KEY.format(main_order_id)))
+    except Exception as e:
+        logger.warning(f"读取订单缓存失败: {e}")
+        return None
+
+
+def cache_order(main_order_id, order_data):
+    if redis_client is None:
+        return
+    try:
+        redis_client.set(ORDER_KEY.format(main_order_id), encode(order_data), ex=CACHE_CONFIG['ORDER_TTL'])
+    except Exception as e:
+        logger.warning(f"写入订单缓存失败: {e}")
+
+
+def invalidate_order(main_order_id, client=None):
+    """
+    订单支付状态或订单状态变更并提交后调用
+    :param client: 传入管道时只把命令加入管道，由调用方统一执行
+    """
+    if client is not None:
+        client.delete(ORDER_KEY.format(main_order_id))
+        return
+    if redis_client is None:
+        return
+    try:
+        redis_client.delete(ORDER_KEY.format(main_order_id))
+    except Exception as e:
+        logger.warning(f"删除订单缓存失败: {e}")
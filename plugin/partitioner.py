@@ -0,0 +1,42 @@
+import bisect
+import zlib
+from config import MESSAGE_BROKER_CONFIG
+
+
+class ConsistentHashRing:
+    """
+    一致性哈希环：把key稳定地映射到分区
+    使用crc32而不是内置hash，保证不同进程计算结果一致
+    """
+
+    def __init__(self, partitions, replicas=64):
+        ring = sorted(
+            (zlib.crc32(f"{partition}-{replica}".encode()), partition)
+            for partition in range(partitions) for replica in range(replicas)
+        )
+        self._hashes = [item[0] for item in ring]
+        self._partitions = [item[1] for item in ring]
+
+    def partition(self, key):
+        index = bisect.bisect(self._hashes, zlib.crc32(str(key).encode())) % len(self._hashes)
+        return self._partitions[index]
+
+
+_ring = ConsistentHashRing(max(MESSAGE_BROKER_CONFIG['PARTITIONS'], 1))
+
+
+def partition_queue(partition):
+    """分区对应的队列名，只有一个分区时沿用原队列名"""
+    base = MESSAGE_BROKER_CONFIG['QUEUE_NAME']
+    if MESSAGE_BROKER_CONFIG['PARTITIONS'] <= 1:
+        return base
+    return f"{base}.{partition}"
+
+
+def queue_for_product(product_id):
+    """商品所属分区的队列名，同一商品的消息始终进入同一队列"""
+    return partition_queue(_ring.partition(product_id))
+
+
+def all_queues():
+    return [partition_queue(partition) for partition in range(max(MESSAGE_BROKER_CONFIG['PARTITIONS'], 1))]
@@ -0,0 +1,269 @@
+"""
+进程内商品过滤器
+
+在进程内保存已知商品ID和已售罄商品ID，秒杀、加购、库存校验先查询过滤器，
+不存在或已售罄的商品直接拒绝，不再访问数据库。
+
+数据来源：
+    Redis集合 product_filter:known / product_filter:sold_out 保存全量数据，
+    变更通过频道 product_filter:events 实时推送到各进程，后台线程再定期拉取全量集合、
+    定期从数据库重建，修正漏收的事件。过滤器未加载或长时间未刷新时返回None，调用方回退到数据库查询。
+"""
+import logging
+import threading
+import time
+from config import PRODUCT_FILTER_CONFIG
+from utils.redis_util import redis_client
+from plugin.catalog_cache import COUNT_KEY
+
+KNOWN_KEY = 'product_filter:known'
+SOLD_OUT_KEY = 'product_filter:sold_out'
+LOADED_KEY = 'product_filter:loaded'  # 集合已从数据库完整构建的标记
+CHANNEL = 'product_filter:events'
+
+# 变更事件，格式为 "<事件>:<商品ID>"
+EVENT_REGISTER = 'register'
+EVENT_UNREGISTER = 'unregister'
+EVENT_SOLD_OUT = 'sold_out'
+EVENT_IN_STOCK = 'in_stock'
+
+logger = logging.getLogger(__name__)
+
+
+class ProductFilter:
+    """
+    已知商品和已售罄商品的只读快照
+    读操作不加锁，写操作整体替换frozenset，读线程总能看到一致的集合
+    """
+
+    def __init__(self, max_staleness=60):
+        self.max_staleness = max_staleness
+        self._known = None  # None表示尚未加载
+        self._sold_out = frozenset()
+        self._refreshed_at = 0
+        self._lock = threading.Lock()
+
+    def ready(self):
+        return self._known is not None and time.time() - self._refreshed_at <= self.max_staleness
+
+    def exists(self, product_id):
+        """商品是否存在；过滤器不可用时返回None，调用方应回退到数据库查询"""
+        if not self.ready():
+            return None
+        try:
+            return int(product_id) in self._known
+        except (TypeError, ValueError):
+            return False
+
+    def sold_out(self, product_id):
+        """商品是否已售罄；过滤器不可用时返回False"""
+        if not self.ready():
+            return False
+        try:
+            return int(product_id) in self._sold_out
+        except (TypeError, ValueError):
+            return False
+
+    def replace(self, known, sold_out):
+        with self._lock:
+            self._known = frozenset(known)
+            self._sold_out = frozenset(sold_out)
+            self._refreshed_at = time.time()
+
+    def apply(self, event, product_id):
+        with self._lock:
+            if self._known is None:
+                return
+            if event == EVENT_REGISTER:
+                self._known = self._known | {product_id}
+            elif event == EVENT_UNREGISTER:
+                self._known = self._known - {product_id}
+                self._sold_out = self._sold_out - {product_id}
+            elif event == EVENT_SOLD_OUT:
+                self._sold_out = self._sold_out | {product_id}
+            elif event == EVENT_IN_STOCK:
+                self._sold_out = self._sold_out - {product_id}
+
+    def stats(self):
+        return {
+            'ready': self.ready(),
+            'known': len(self._known) if self._known is not None else None,
+            'sold_out': len(self._sold_out),
+            'age': round(time.time() - self._refreshed_at, 3) if self._refreshed_at else None
+        }
+
+
+product_filter = ProductFilter(PRODUCT_FILTER_CONFIG['MAX_STALENESS'])
+
+
+def _queue_event(pipe, event, product_id):
+    if event == EVENT_REGISTER:
+        pipe.sadd(KNOWN_KEY, product_id)
+    elif event == EVENT_UNREGISTER:
+        pipe.srem(KNOWN_KEY, product_id)
+        pipe.srem(SOLD_OUT_KEY, product_id)
+    elif event == EVENT_SOLD_OUT:
+        pipe.sadd(SOLD_OUT_KEY, product_id)
+    elif event == EVENT_IN_STOCK:
+        pipe.srem(SOLD_OUT_KEY, product_id)
+    pipe.publish(CHANNEL, f"{event}:{product_id}")
+
+
+def _publish(event, product_id, client=None):
+    """
+    更新本进程的过滤器，并写入Redis、通知其他进程；失败只记录日志
+    :param client: 传入管道时只把命令加入管道，由调用方统一执行
+    """
+    product_id = int(product_id)
+    product_filter.apply(event, product_id)
+    if client is not None:
+        _queue_event(client, event, product_id)
+        return
+    if redis_client is None:
+        return
+    try:
+        pipe = redis_client.pipeline()
+        _queue_event(pipe, event, product_id)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"商品过滤器变更同步失败: {e}")
+
+
+def register_product(product_id):
+    _publish(EVENT_REGISTER, product_id)
+
+
+def unregister_product(product_id):
+    _publish(EVENT_UNREGISTER, product_id)
+
+
+def mark_sold_out(product_id, client=None):
+    _publish(EVENT_SOLD_OUT, product_id, client)
+
+
+def mark_in_stock(product_id, client=None):
+    _publish(EVENT_IN_STOCK, product_id, client)
+
+
+def update_stock_state(product_id, stock, client=None):
+    """按最新库存标记商品是否售罄"""
+    if stock > 0:
+        mark_in_stock(product_id, client)
+    else:
+        mark_sold_out(product_id, client)
+
+
+def rebuild_from_db():
+    """
+    从数据库重建过滤器（需要应用上下文）
+    已售罄集合以数据库库存为准；秒杀预扣售罄时数据库库存可能尚未扣减，
+    因此Redis中已标记的商品只有在秒杀库存键仍存在且为0时才保留，库存键过期或补货后标记随重建清除
+    """
+    from models import db, Product
+    from plugin.flash_sale_stock import STOCK_KEY
+
+    rows = db.session.query(Product.id, Product.stock).all()
+    db.session.rollback()  # 只读查询，及时归还连接
+    known = {row.id for row in rows}
+    sold_out = {row.id for row in rows if row.stock <= 0}
+
+    if redis_client is not None:
+        marked = sorted({int(member) for member in redis_client.smembers(SOLD_OUT_KEY)} & known - sold_out)
+        if marked:
+            pipe = redis_client.pipeline(transaction=False)
+            for product_id in marked:
+                pipe.get(STOCK_KEY.format(product_id))
+            for product_id, stock in zip(marked, pipe.execute()):
+                if stock is not None and int(stock) <= 0:
+                    sold_out.add(product_id)
+        pipe = redis_client.pipeline(transaction=True)
+        pipe.delete(KNOWN_KEY, SOLD_OUT_KEY)
+        if known:
+            pipe.sadd(KNOWN_KEY, *known)
+        if sold_out:
+            pipe.sadd(SOLD_OUT_KEY, *sold_out)
+        pipe.set(LOADED_KEY, int(time.time()))
+        pipe.set(COUNT_KEY, len(known))  # 顺带校正增量维护的商品总数
+        pipe.execute()
+
+    product_filter.replace(known, sold_out)
+    print(f"商品过滤器已重建: {len(known)} 个商品，{len(sold_out)} 个已售罄")
+
+
+def refresh_from_redis(app):
+    """拉取Redis中的全量集合；集合尚未构建时从数据库重建"""
+    pipe = redis_client.pipeline()
+    pipe.exists(LOADED_KEY)
+    pipe.smembers(KNOWN_KEY)
+    pipe.smembers(SOLD_OUT_KEY)
+    loaded, known, sold_out = pipe.execute()
+    if not loaded:
+        with app.app_context():
+            rebuild_from_db()
+        return
+    product_filter.replace({int(member) for member in known}, {int(member) for member in sold_out})
+
+
+def _handle_event(data):
+    if isinstance(data, bytes):
+        data = data.decode()
+    event, _, product_id = data.partition(':')
+    try:
+        product_filter.apply(event, int(product_id))
+    except ValueError:
+        logger.warning(f"无法识别的商品过滤器事件: {data}")
+
+
+def _run(app, refresh_interval, resync_interval):
+    pubsub = None
+    last_refresh = 0
+    last_resync = 0
+    while True:
+        try:
+            if redis_client is not None and pubsub is None:
+                pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(CHANNEL)
+
+            if pubsub is not None:
+                message = pubsub.get_message(timeout=1.0)
+                if message:
+                    _handle_event(message['data'])
+            else:
+                time.sleep(1)
+
+            now = time.time()
+            if now - last_resync >= resync_interval:
+                with app.app_context():
+                    rebuild_from_db()
+                last_resync = last_refresh = now
+            elif redis_client is not None and now - last_refresh >= refresh_interval:
+                refresh_from_redis(app)
+                last_refresh = now
+            elif redis_client is None and now - last_refresh >= refresh_interval:
+                # 未启用Redis时直接从数据库刷新
+                with app.app_context():
+                    rebuild_from_db()
+                last_refresh = now
+        except Exception as e:
+            logger.warning(f"商品过滤器刷新失败: {e}")
+            if pubsub is not None:
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
+                pubsub = None
+            time.sleep(1)
+
+
+def start_product_filter(app):
+    """启动后台刷新线程，未启动时过滤器始终不可用，调用方全部回退到数据库查询"""
+    if not PRODUCT_FILTER_CONFIG['ENABLED']:
+        return None
+    thread = threading.Thread(
+        target=_run,
+        args=(app, PRODUCT_FILTER_CONFIG['REFRESH_INTERVAL'], PRODUCT_FILTER_CONFIG['RESYNC_INTERVAL']),
+        name='product-filter',
+        daemon=True
+    )
+    thread.start()
+    return thread
@@ -0,0 +1,208 @@
+"""
+进程内商品搜索索引
+
+按商品名称建立倒排索引：中文按字切分为单字和相邻两字，英文和数字按词切分并索引2个字符以上的前缀。
+查询时中文切为两字词（单字查询用单字），英文按整词匹配索引中的前缀；
+结果按匹配程度（命中词比例、名称完全相同、名称前缀、名称包含）排序，再按有货优先、库存从多到少排序。
+索引在启动时从数据库构建，商品新增、删除、改库存时同步更新，并定期全量重建以合并其他进程的变更。
+"""
+import heapq
+import re
+import threading
+import time
+from collections import defaultdict
+from config import SEARCH_CONFIG
+
+_CJK = '\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff'
+_SEGMENT = re.compile(f'([{_CJK}]+)|([0-9a-z\u00c0-\u024f]+)')
+PREFIX_MIN_LENGTH = 2
+
+
+def normalize(text):
+    return ' '.join((text or '').lower().split())
+
+
+def index_terms(name):
+    """商品名称 -> 索引词集合"""
+    terms = set()
+    for cjk, word in _SEGMENT.findall(normalize(name)):
+        if cjk:
+            terms.update(cjk)
+            terms.update(cjk[i:i + 2] for i in range(len(cjk) - 1))
+        else:
+            terms.add(word)
+            terms.update(word[:i] for i in range(PREFIX_MIN_LENGTH, len(word)))
+    return terms
+
+
+def query_terms(query):
+    """查询串 -> 查询词列表（去重并保持顺序）"""
+    terms = []
+    for cjk, word in _SEGMENT.findall(normalize(query)):
+        if cjk:
+            terms.extend([cjk] if len(cjk) == 1 else [cjk[i:i + 2] for i in range(len(cjk) - 1)])
+        else:
+            terms.append(word)
+    return list(dict.fromkeys(terms))
+
+
+class SearchIndex:
+    def __init__(self):
+        self._postings = defaultdict(set)  # 索引词 -> 商品ID集合
+        self._docs = {}  # 商品ID -> 商品字典（含索引词）
+        self._lock = threading.Lock()
+        self.built_at = 0
+
+    def built(self):
+        return self.built_at > 0
+
+    def replace(self, products):
+        """用全量商品重建索引，构建完成后整体替换"""
+        postings = defaultdict(set)
+        docs = {}
+        for product in products:
+            doc = self._make_doc(product)
+            docs[doc['id']] = doc
+            for term in doc['terms']:
+                postings[term].add(doc['id'])
+        with self._lock:
+            self._postings = postings
+            self._docs = docs
+            self.built_at = time.time()
+
+    def add(self, product):
+        doc = self._make_doc(product)
+        with self._lock:
+            self._remove(doc['id'])
+            self._docs[doc['id']] = doc
+            for term in doc['terms']:
+                self._postings[term].add(doc['id'])
+
+    def remove(self, product_id):
+        with self._lock:
+            self._remove(product_id)
+
+    def update_stock(self, product_id, stock):
+        with self._lock:
+            doc = self._docs.get(product_id)
+            if doc is not None:
+                doc['stock'] = stock
+
+    def search(self, query, limit=20):
+        """
+        :return: (按相关度排序的前limit个商品, 满足最低匹配比例的商品总数)
+        """
+        terms = query_terms(query)
+        if not terms:
+            return [], 0
+        normalized = normalize(query)
+        min_hits = max(1, int(len(terms) * SEARCH_CONFIG['MIN_COVERAGE'] + 0.999))
+
+        with self._lock:
+            hits = defaultdict(int)
+            for term in terms:
+                for product_id in self._postings.get(term, ()):
+                    hits[product_id] += 1
+            candidates = [
+                (hit_count, self._docs[product_id]) for product_id, hit_count in hits.items()
+                if hit_count >= min_hits
+            ]
+
+            def rank(item):
+                hit_count, doc = item
+                name = doc['normalized']
+                return (
+                    -hit_count,
+                    name != normalized,
+                    not name.startswith(normalized),
+                    normalized not in name,
+                    doc['stock'] <= 0,
+                    -doc['stock'],
+                    len(name),
+                    doc['id']
+                )
+
+            top = heapq.nsmallest(limit, candidates, key=rank)
+            results = [{key: doc[key] for key in ('id', 'name', 'price', 'stock')} for _, doc in top]
+        return results, len(candidates)
+
+    def stats(self):
+        with self._lock:
+            return {'products': len(self._docs), 'terms': len(self._postings), 'built_at': self.built_at}
+
+    @staticmethod
+    def _make_doc(product):
+        return {
+            'id': product['id'],
+            'name': product['name'],
+            'price': product['price'],
+            'stock': product['stock'],
+            'normalized': normalize(product['name']),
+            'terms': index_terms(product['name'])
+        }
+
+    def _remove(self, product_id):
+        doc = self._docs.pop(product_id, None)
+        if doc is None:
+            return
+        for term in doc['terms']:
+            ids = self._postings.get(term)
+            if ids is not None:
+                ids.discard(product_id)
+                if not ids:
+                    del self._postings[term]
+
+
+search_index = SearchIndex()
+_build_lock = threading.Lock()
+
+
+def build_search_index():
+    """从数据库全量构建索引（需要应用上下文）"""
+    from models import db, Product
+
+    rows = db.session.query(Product.id, Product.name, Product.price, Product.stock).all()
+    db.session.rollback()
+    search_index.replace({'id': row.id, 'name': row.name, 'price': row.price, 'stock': row.stock} for row in rows)
+    print(f"商品搜索索引已构建: {len(rows)} 个商品")
+
+
+def ensure_search_index():
+    """索引尚未构建时在当前请求中构建一次（需要应用上下文）"""
+    if search_index.built():
+        return
+    with _build_lock:
+        if not search_index.built():
+            build_search_index()
+
+
+def index_product(product):
+    search_index.add({'id': product.id, 'name': product.name, 'price': product.price, 'stock': product.stock})
+
+
+def unindex_product(product_id):
+    search_index.remove(product_id)
+
+
+def update_indexed_stock(product_id, stock):
+    search_index.update_stock(product_id, stock)
+
+
+def start_search_indexer(app):
+    """启动时构建索引，之后定期全量重建，合并其他进程中的商品变更"""
+    interval = SEARCH_CONFIG['REBUILD_INTERVAL']
+
+    def run():
+        while True:
+            try:
+                with app.app_context():
+                    build_search_index()
+            except Exception as e:
+                print(f"构建商品搜索索引失败: {e}")
+            if not interval:
+                return
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name='product-search-indexer', daemon=True)
+    thread.start()
+    return thread
@@ -18,7 +18,26 @@ class RabbitMQConnectionPool:
         for _ in range(min_size):
             self._add_connection()
 
-    def _add_connection(self):
+    def _add_connection(self, deadline=None):
+        """
+        新建一条连接放入池中
+        :param deadline: 截止时间（time.time()），给定时只尝试一次，且握手耗时不超过剩余时间
+        """
+        retry = {
+            'connection_attempts': 5,  # 增加重试次数
+            'retry_delay': 3,  # 增加重试间隔
+            'socket_timeout': 10  # 增加socket超时
+        }
+        if deadline is not None:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            retry = {
+                'connection_attempts': 1,
+                'retry_delay': 0,
+                'socket_timeout': min(10, remaining),
+                'stack_timeout': remaining  # 限制TCP连接+AMQP握手的总耗时
+            }
         try:
             conn = pika.BlockingConnection(pika.ConnectionParameters(
                 host=self.config['HOST'],
@@ -30,9 +49,7 @@ class RabbitMQConnectionPool:
                 ),
                 heartbeat=60,  # 增加心跳间隔
                 blocked_connection_timeout=300,
-                connection_attempts=5,  # 增加重试次数
-                retry_delay=3,  # 增加重试间隔
-                socket_timeout=10  # 增加socket超时
+                **retry
             ))
             self._pool.put(conn)
             self._active_connections += 1
@@ -43,7 +60,8 @@ class RabbitMQConnectionPool:
 
     def get_connection(self, timeout=10):
         start_time = time.time()
-        while time.time() - start_time < timeout:
+        deadline = start_time + timeout
+        while time.time() < deadline:
             try:
                 if not self._pool.empty() or self._active_connections < self.max_size:
                     with self._lock:
@@ -52,7 +70,7 @@ class RabbitMQConnectionPool:
                             if conn and not conn.is_closed:
                                 return conn
                         if self._active_connections < self.max_size:
-                            if self._add_connection():
+                            if self._add_connection(deadline):
                                 return self._pool.get()
                 time.sleep(0.1)
             except Exception as e:
@@ -65,4 +83,14 @@ class RabbitMQConnectionPool:
                 self._pool.put(conn)
             except:
                 conn.close()
-                self._active_connections -= 1
\ No newline at end of file
+                self._active_connections -= 1
+
+    def discard_connection(self, conn):
+        """丢弃已损坏的连接，释放名额以便重新创建"""
+        try:
+            if conn and not conn.is_closed:
+                conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._active_connections -= 1
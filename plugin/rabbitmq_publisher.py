@@ -0,0 +1,199 @@
+import pika
+import threading
+import time
+import logging
+from queue import Queue, Empty
+from threading import Lock
+from plugin.rabbitmq_pool import RabbitMQConnectionPool
+
+
+class PublishError(Exception):
+    """消息发布失败：无可用通道、连接断开或Broker拒收"""
+
+
+class _PooledChannel:
+    def __init__(self, connection, channel):
+        self.connection = connection
+        self.channel = channel
+
+
+class RabbitMQPublisher:
+    """
+    线程安全的发布通道池
+    每个通道独占一条连接，借出期间只被一个线程使用；通道开启publisher confirm，
+    发布成功即表示Broker已持久化。断线重连和空闲连接心跳都在后台线程完成，请求线程最多等待 checkout_timeout。
+    """
+
+    def __init__(self, config, pool_size=8, checkout_timeout=0.5, reconnect_interval=5, queues=None):
+        self.config = config
+        self.queues = queues or {config['QUEUE_NAME']: None}  # 队列名 -> 声明参数
+        self.pool_size = pool_size
+        self.checkout_timeout = checkout_timeout
+        self.reconnect_interval = reconnect_interval
+        self.logger = logging.getLogger(__name__)
+
+        self._connection_pool = RabbitMQConnectionPool(config, max_size=pool_size, min_size=0)
+        self._idle = Queue()
+        self._lock = Lock()
+        self._channels = 0  # 已建立的通道总数（空闲+借出）
+        self._in_use = 0
+        self._waiting = 0
+        self._counters = {
+            'published': 0,
+            'publish_failures': 0,
+            'checkout_timeouts': 0,
+            'channels_opened': 0,
+            'channels_discarded': 0
+        }
+        self._checkout_wait_total = 0.0
+        self._checkouts = 0
+        self._wakeup = threading.Event()
+
+        # 通道全部由后台线程建立，导入时不阻塞；通道就绪前 available() 为False，调用方走降级逻辑
+        self._thread = threading.Thread(target=self._maintain, name='rabbitmq-publisher', daemon=True)
+        self._thread.start()
+
+    def available(self):
+        """当前是否有可用通道，无通道时调用方应立即走降级逻辑"""
+        return self._channels > 0
+
+    def publish(self, routing_key, body, headers=None, retries=1):
+        """
+        发布一条持久化消息并等待Broker确认
+        :param routing_key: 队列名
+        :param body: 消息体
+        :param headers: 消息头
+        :param retries: 连接断开时换通道重试的次数
+        """
+        for attempt in range(retries + 1):
+            entry = self._checkout()
+            try:
+                entry.channel.basic_publish(
+                    exchange='',
+                    routing_key=routing_key,
+                    body=body,
+                    properties=pika.BasicProperties(delivery_mode=2, headers=headers),
+                    mandatory=True
+                )
+            except (pika.exceptions.UnroutableError, pika.exceptions.NackError) as e:
+                self._checkin(entry)
+                self._count('publish_failures')
+                raise PublishError(f"消息被Broker拒收: {e}")
+            except Exception as e:
+                self._discard(entry)
+                self._count('publish_failures')
+                if attempt < retries:
+                    continue
+                raise PublishError(f"RabbitMQ发布失败: {e}")
+            self._checkin(entry)
+            self._count('published')
+            return
+
+    def queue_depth(self, queue):
+        """队列中待消费的消息数"""
+        entry = self._checkout()
+        try:
+            depth = entry.channel.queue_declare(queue=queue, durable=True, passive=True).method.message_count
+        except Exception as e:
+            self._discard(entry)
+            raise PublishError(f"查询队列长度失败: {e}")
+        self._checkin(entry)
+        return depth
+
+    def stats(self):
+        """连接池占用情况和发布计数"""
+        with self._lock:
+            data = dict(self._counters)
+            data.update({
+                'pool_size': self.pool_size,
+                'channels': self._channels,
+                'idle': self._idle.qsize(),
+                'in_use': self._in_use,
+                'waiting': self._waiting,
+                'avg_checkout_wait_ms': round(self._checkout_wait_total / self._checkouts * 1000, 3)
+                if self._checkouts else 0.0
+            })
+        return data
+
+    def _checkout(self):
+        start_time = time.time()
+        with self._lock:
+            self._waiting += 1
+        try:
+            entry = self._idle.get(timeout=self.checkout_timeout)
+        except Empty:
+            self._count('checkout_timeouts')
+            raise PublishError("获取RabbitMQ发布通道超时")
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+        with self._lock:
+            self._in_use += 1
+            self._checkouts += 1
+            self._checkout_wait_total += time.time() - start_time
+        return entry
+
+    def _checkin(self, entry):
+        with self._lock:
+            self._in_use -= 1
+        self._idle.put(entry)
+
+    def _discard(self, entry, checked_out=True):
+        self._connection_pool.discard_connection(entry.connection)
+        with self._lock:
+            self._channels -= 1
+            if checked_out:
+                self._in_use -= 1
+            self._counters['channels_discarded'] += 1
+        self._wakeup.set()  # 通知后台线程立即补齐
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _open_channel(self):
+        try:
+            connection = self._connection_pool.get_connection(timeout=1)
+        except Exception as e:
+            self.logger.warning(f"创建RabbitMQ发布连接失败: {e}")
+            return False
+
+        try:
+            channel = connection.channel()
+            channel.confirm_delivery()
+            for queue, arguments in self.queues.items():
+                channel.queue_declare(queue=queue, durable=True, arguments=arguments)
+        except Exception as e:
+            self.logger.warning(f"创建RabbitMQ发布通道失败: {e}")
+            self._connection_pool.discard_connection(connection)
+            return False
+
+        with self._lock:
+            self._channels += 1
+            self._counters['channels_opened'] += 1
+        self._idle.put(_PooledChannel(connection, channel))
+        return True
+
+    def _keepalive(self):
+        """处理空闲连接的心跳，顺带剔除已断开的连接"""
+        for _ in range(self._idle.qsize()):
+            try:
+                entry = self._idle.get_nowait()
+            except Empty:
+                break
+            try:
+                entry.connection.process_data_events(time_limit=0)
+                self._idle.put(entry)
+            except Exception as e:
+                self.logger.warning(f"RabbitMQ发布连接已断开: {e}")
+                self._discard(entry, checked_out=False)
+
+    def _maintain(self):
+        while True:
+            while self._channels < self.pool_size:
+                if not self._open_channel():
+                    break
+            self._keepalive()
+            self._wakeup.wait(self.reconnect_interval)
+            self._wakeup.clear()
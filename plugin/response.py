@@ -1,4 +1,5 @@
-from flask import jsonify
+import hashlib
+from flask import jsonify, request, make_response
 
 def success(data=None, msg="成功", code=200):
     """
@@ -26,4 +27,31 @@ def error(msg="失败", code=400, data=None):
         "msg": msg,
         "data": data
     }
-    return jsonify(response)
\ No newline at end of file
+    return jsonify(response)
+
+
+def make_etag(*parts):
+    """
+    由版本号、状态等轻量数据计算强ETag，不需要先构建响应体
+    :param parts: 可repr的值，内容相同则ETag相同
+    """
+    return hashlib.blake2b(repr(parts).encode('utf-8'), digest_size=16).hexdigest()
+
+
+def bytes_etag(raw):
+    """由已序列化的响应体（如缓存中的JSON字节串）计算强ETag"""
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+
+def conditional_response(etag, build):
+    """
+    条件请求：If-None-Match 命中时直接返回304，不调用build
+    :param etag: 强ETag
+    :param build: 无参函数，返回视图函数可返回的任意响应（响应对象或 (body, status) 元组）
+    """
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        response = make_response(build())
+    response.set_etag(etag)
+    return response
@@ -1,7 +1,12 @@
 from models import Product
+from plugin.product_filter import product_filter
 
 def check_product_stock(product_id, quantity):
     """检查产品库存，返回布尔值"""
+    # 过滤器确认不存在或已售罄时不查询数据库
+    if product_filter.exists(product_id) is False or product_filter.sold_out(product_id):
+        return False
+
     product = Product.query.get(product_id)
     if not product:
         return False  # 产品不存在
@@ -0,0 +1,15 @@
+from threading import Lock
+
+
+class StripedLock:
+    """
+    分段锁：按key哈希到固定数量的锁上
+    不同商品大概率落在不同的锁上，单个热门商品不会阻塞其他商品的购买
+    """
+
+    def __init__(self, stripes=64):
+        self._locks = [Lock() for _ in range(stripes)]
+
+    def get(self, key):
+        """获取key对应的锁，可直接用于 with 语句"""
+        return self._locks[hash(key) % len(self._locks)]
@@ -0,0 +1,211 @@
+"""
+两级缓存：进程内LRU + Redis
+
+读取顺序为进程内缓存 -> Redis -> loader（数据库）。
+    - 同一进程内同一个键同时未命中时只有一个请求执行loader，其余请求等待其结果（singleflight）
+    - Redis中的值记录了上次重建耗时，命中时按概率提前在后台重建（剩余时间越短、重建越慢，概率越高），
+      热点键在过期前就被刷新，不会出现大量请求同时未命中
+缓存值统一为JSON字节串，可直接作为响应体返回。
+"""
+import logging
+import math
+import random
+import struct
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, has_app_context
+from utils.cache_serializer import dumps, encode_json, decode_json
+
+_DELTA = struct.Struct('!d')  # Redis值的前8字节：上次重建耗时（秒）
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    """一次进行中的加载，同一个键的并发请求共享结果"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class TwoTierCache:
+    def __init__(self, client, ttl=60, local_size=1024, local_ttl=2, beta=1.0, load_timeout=10):
+        self.client = client
+        self.ttl = ttl
+        self.local_size = local_size
+        self.local_ttl = local_ttl
+        self.beta = beta
+        self.load_timeout = load_timeout
+
+        self._local = OrderedDict()  # 键 -> (JSON字节串, 过期时间)
+        self._local_lock = threading.Lock()
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+        self._counters = {
+            'local_hits': 0,
+            'redis_hits': 0,
+            'loads': 0,
+            'coalesced': 0,
+            'early_refreshes': 0,
+            'redis_errors': 0
+        }
+
+    def get(self, key, loader, ttl=None):
+        """
+        读取缓存，未命中时调用loader
+        :param key: 缓存键
+        :param loader: 无参函数，返回可JSON序列化的对象
+        :param ttl: Redis缓存时间（秒），默认使用构造参数
+        :return: JSON字节串
+        """
+        raw = self._local_get(key)
+        if raw is not None:
+            self._count('local_hits')
+            return raw
+
+        entry = self._redis_get(key)
+        if entry is not None:
+            raw, delta, remaining = entry
+            self._count('redis_hits')
+            self._local_set(key, raw)
+            if self._should_refresh(delta, remaining):
+                self._refresh_async(key, loader, ttl)
+            return raw
+
+        return self._load(key, loader, ttl)
+
+    def clear_local(self):
+        with self._local_lock:
+            self._local.clear()
+
+    def stats(self):
+        with self._local_lock:
+            data = dict(self._counters)
+            data['local_keys'] = len(self._local)
+        with self._flights_lock:
+            data['in_flight'] = len(self._flights)
+        return data
+
+    def _count(self, name):
+        with self._local_lock:
+            self._counters[name] += 1
+
+    def _local_get(self, key):
+        with self._local_lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return None
+            raw, expires_at = entry
+            if expires_at < time.time():
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+            return raw
+
+    def _local_set(self, key, raw):
+        if self.local_ttl <= 0:
+            return
+        with self._local_lock:
+            self._local[key] = (raw, time.time() + self.local_ttl)
+            self._local.move_to_end(key)
+            while len(self._local) > self.local_size:
+                self._local.popitem(last=False)
+
+    def _redis_get(self, key):
+        """返回 (JSON字节串, 上次重建耗时, 剩余有效秒数)，未命中或出错返回None"""
+        if self.client is None:
+            return None
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.get(key)
+            pipe.pttl(key)
+            value, pttl = pipe.execute()
+        except Exception as e:
+            self._count('redis_errors')
+            logger.warning(f"读取Redis缓存失败: {e}")
+            return None
+        if not value or len(value) <= _DELTA.size:
+            return None
+        raw = decode_json(value[_DELTA.size:])
+        if raw is None:
+            return None
+        delta = _DELTA.unpack(value[:_DELTA.size])[0]
+        return raw, delta, pttl / 1000.0 if pttl > 0 else 0
+
+    def _redis_set(self, key, raw, delta, ttl):
+        if self.client is None:
+            return
+        try:
+            self.client.setex(key, ttl or self.ttl, _DELTA.pack(delta) + encode_json(raw))
+        except Exception as e:
+            self._count('redis_errors')
+            logger.warning(f"写入Redis缓存失败: {e}")
+
+    def _should_refresh(self, delta, remaining):
+        """概率提前刷新：-delta * beta * ln(rand) >= 剩余时间 时重建"""
+        if self.beta <= 0 or remaining <= 0:
+            return False
+        return -delta * self.beta * math.log(1.0 - random.random()) >= remaining
+
+    def _compute(self, key, loader, ttl):
+        self._count('loads')
+        start_time = time.time()
+        raw = dumps(loader())
+        self._redis_set(key, raw, time.time() - start_time, ttl)
+        self._local_set(key, raw)
+        return raw
+
+    def _join_flight(self, key):
+        """返回 (flight, 是否由当前请求负责加载)"""
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                return flight, False
+            flight = self._flights[key] = _Flight()
+            return flight, True
+
+    def _finish_flight(self, key, flight, compute):
+        try:
+            flight.value = compute()
+        except Exception as e:
+            flight.error = e
+        finally:
+            flight.event.set()
+            with self._flights_lock:
+                self._flights.pop(key, None)
+
+    def _load(self, key, loader, ttl):
+        flight, leader = self._join_flight(key)
+        if leader:
+            self._finish_flight(key, flight, lambda: self._compute(key, loader, ttl))
+        else:
+            self._count('coalesced')
+            if not flight.event.wait(self.load_timeout):
+                # 等待超时，不再依赖其他请求，自行加载
+                return self._compute(key, loader, ttl)
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    def _refresh_async(self, key, loader, ttl):
+        flight, leader = self._join_flight(key)
+        if not leader:
+            return  # 已有请求在重建
+        self._count('early_refreshes')
+        app = current_app._get_current_object() if has_app_context() else None
+
+        def compute():
+            if app is None:
+                return self._compute(key, loader, ttl)
+            with app.app_context():
+                return self._compute(key, loader, ttl)
+
+        def run():
+            self._finish_flight(key, flight, compute)
+            if flight.error is not None:
+                logger.warning(f"提前刷新缓存失败: {key}: {flight.error}")
+
+        threading.Thread(target=run, name=f'cache-refresh-{key}', daemon=True).start()
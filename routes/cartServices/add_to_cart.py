@@ -4,6 +4,7 @@ from datetime import datetime
 from flasgger import swag_from
 
 from plugin.auth import extract_token
+from plugin.product_filter import product_filter
 
 add_to_cart_bp = Blueprint('add_to_cart', __name__)
 
@@ -68,6 +69,11 @@ def add_to_cart():
     if not items:
         return jsonify({"error": "No items to add"}), 400
 
+    # 先用进程内过滤器排除不存在的商品，避免创建购物车后再回滚
+    for item in items:
+        if product_filter.exists(item['product_id']) is False:
+            return jsonify({"error": f"Product with ID {item['product_id']} not found"}), 400
+
     total_price = 0.0
     cart = Cart(user_id=user.id, total_price=0.0)
     db.session.add(cart)
@@ -1,135 +1,31 @@
 from flask import Blueprint, request, jsonify
 from flasgger import swag_from
-from models import db, User, Product, Order, FlashSaleOrder
-from plugin.auth import extract_token
+from models import User, Product
+from plugin.auth import extract_token, check_admin_role
 from plugin.stock_checker import check_product_stock
-from datetime import datetime
+from plugin.flash_sale_result import new_ticket, save_result, get_result, RESULT_PENDING
+from plugin.message_broker import create_broker, BrokerError, dead_letter_queue
+from plugin.partitioner import queue_for_product, all_queues
+from plugin.flash_sale_stock import (
+    stock_gate_enabled, load_stock, peek_stock, reserve_stock, release_stock,
+    RESERVE_NOT_LOADED, RESERVE_SOLD_OUT, RESERVE_LIMIT_EXCEEDED, RESERVE_INSUFFICIENT, RESERVE_OK
+)
+from plugin.product_filter import product_filter, mark_sold_out
 import time
 import requests
-import pika
 import threading  # 添加这行导入
-from threading import Lock
-from config import RABBITMQ_CONFIG
+from config import RABBITMQ_CONFIG, FLASH_SALE_CONFIG, MESSAGE_BROKER_CONFIG
+from utils.redis_util import redis_client
+from services.flash_sale_service import (
+    settle_flash_sale, SETTLE_SUCCESS, SETTLE_INVALID, SETTLE_SOLD_OUT, SETTLE_NO_BALANCE
+)
+from services.flash_sale_consumer import run_consumer
 import json  # 导入json模块
-from sqlalchemy.exc import DatabaseError, IntegrityError
+import redis
 
 flash_sale_bp = Blueprint('flash_sale', __name__)
 
-# 添加消费者处理函数
-def process_flash_sale():
-    if rabbitmq_channel is None:
-        print("RabbitMQ不可用，消费者线程终止")
-        return
-
-    def flash_sale_callback(ch, method, properties, body):
-        from app import create_app  # 导入create_app函数
-        app = create_app()  # 创建应用实例
-        
-        with app.app_context():  # 添加应用上下文
-            try:
-                data = json.loads(body)
-                user_id = data['user_id']
-                product_id = data['product_id']
-                quantity = data['quantity']
-
-                try:
-                    # 在直接处理逻辑中添加
-                    with order_lock:
-                        product = db.session.query(Product).filter_by(id=product_id).with_for_update().first()
-                        user = db.session.query(User).filter_by(id=user_id).with_for_update().first()
-
-                        if not user or not product:
-                            ch.basic_nack(delivery_tag=method.delivery_tag)
-                            return
-
-                        total_amount = product.price * quantity
-
-                        # 双重检查库存和余额
-                        if user.balance < total_amount or product.stock < quantity:
-                            ch.basic_nack(delivery_tag=method.delivery_tag)
-                            return
-
-                        # 执行订单创建
-                        try:
-                            user.balance -= total_amount
-                            product.stock -= quantity
-                            new_order = Order(product_id=product.id, user_id=user.id, quantity=quantity)
-                            db.session.add(new_order)
-
-                            flash_sale_order = FlashSaleOrder(
-                                product_id=product.id,
-                                user_id=user.id,
-                                amount=total_amount,
-                                purchase_time=datetime.utcnow()
-                            )
-                            db.session.add(flash_sale_order)
-
-                            db.session.commit()
-                            ch.basic_ack(delivery_tag=method.delivery_tag)
-                            print(f"成功创建订单，剩余库存: {product.stock}")
-                        except Exception as e:
-                            db.session.rollback()
-                            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
-                            print(f"订单创建失败: {e}")
-
-                except Exception as e:
-                    db.session.rollback()
-                    ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
-                    print(f"处理消息时发生错误: {e}")
-            except Exception as e:  # 添加最外层异常捕获
-                db.session.rollback()
-                ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
-                print(f"消息解析失败: {e}")
-
-    # 启动消费者
-    try:
-        rabbitmq_channel.basic_qos(prefetch_count=1)  # 每次只处理一个消息
-        rabbitmq_channel.basic_consume(
-            queue='flash_sale_queue',
-            on_message_callback=flash_sale_callback,  # 修改为新的回调函数名
-            auto_ack=False
-        )
-        print("开始消费消息队列...")
-        rabbitmq_channel.start_consuming()
-    except Exception as e:
-        print(f"RabbitMQ消费错误: {e}")
-
-
-# 修改RabbitMQ初始化逻辑
-def init_rabbitmq():
-    try:
-        credentials = pika.PlainCredentials(
-            RABBITMQ_CONFIG['USERNAME'],
-            RABBITMQ_CONFIG['PASSWORD']
-        )
-        parameters = pika.ConnectionParameters(
-            host=RABBITMQ_CONFIG['HOST'],
-            port=RABBITMQ_CONFIG['PORT'],
-            virtual_host=RABBITMQ_CONFIG['VIRTUAL_HOST'],
-            credentials=credentials,
-            heartbeat=RABBITMQ_CONFIG['HEARTBEAT'],
-            blocked_connection_timeout=RABBITMQ_CONFIG['BLOCKED_CONNECTION_TIMEOUT'],
-            # Add these new parameters
-            connection_attempts=3,  # Retry connection 3 times
-            retry_delay=5,  # Wait 5 seconds between retries
-            socket_timeout=10,  # Socket operation timeout
-            stack_timeout=10,  # Protocol negotiation timeout
-            frame_max=131072  # Increase max frame size to prevent frame_too_large errors
-        )
-        connection = pika.BlockingConnection(parameters)
-        channel = connection.channel()
-        channel.queue_declare(
-            queue=RABBITMQ_CONFIG['QUEUE_NAME'],
-            durable=True
-        )
-        return channel
-    except Exception as e:
-        print(f"RabbitMQ连接失败: {e}, 将使用直接处理模式")
-        return None
-
-
-rabbitmq_channel = init_rabbitmq()
-order_lock = Lock()
+broker = create_broker(MESSAGE_BROKER_CONFIG, RABBITMQ_CONFIG, redis_client, all_queues())
 
 
 @flash_sale_bp.route('/flash_sale', methods=['POST'])
@@ -161,107 +57,259 @@ order_lock = Lock()
     }
 })
 def flash_sale():
-    global rabbitmq_channel  # 添加这行声明全局变量
     time.sleep(0.5)
     token = extract_token(request)
 
+    data = request.json
+    product_id = data['product_id']
+    quantity = data['quantity']
+
+    # 进程内过滤器：不存在的商品直接返回，不访问数据库
+    if product_filter.exists(product_id) is False:
+        return jsonify({"error": "Product not found"}), 404
+
+    if stock_gate_enabled():
+        # 开启库存预扣时以Redis库存键为准，在查询用户之前拦截售罄和库存不足的请求，这些请求不访问数据库；
+        # 键不存在（未加载、已过期或补货后删除）时继续往下走，由预扣懒加载最新库存
+        try:
+            remaining = peek_stock(product_id)
+        except redis.exceptions.RedisError as e:
+            print(f"读取Redis库存失败: {e}")
+            remaining = None
+        if remaining is not None and remaining <= 0:
+            if not product_filter.sold_out(product_id):
+                mark_sold_out(product_id)
+            return jsonify({"status": "failed", "reason": "Sold out"}), 200
+        if remaining is not None and remaining < quantity:
+            return jsonify({"status": "failed", "reason": "Insufficient stock"}), 200
+    elif product_filter.sold_out(product_id):
+        return jsonify({"status": "failed", "reason": "Sold out"}), 200
+
     user = User.query.filter_by(token=token).first()
 
     if not user:
         return jsonify({"error": "Invalid token"}), 400
 
-    data = request.json
-    product_id = data['product_id']
-    quantity = data['quantity']
+    # Redis库存预扣：售罄或超出限购的请求直接返回，不访问数据库和消息队列
+    reserved = False
+    if stock_gate_enabled():
+        try:
+            result = reserve_stock(product_id, user.id, quantity)
+            if result == RESERVE_NOT_LOADED:
+                # 库存尚未加载，从数据库懒加载一次
+                product = Product.query.get(product_id)
+                if not product:
+                    return jsonify({"error": "Product not found"}), 404
+                load_stock(product_id, product.stock, only_if_missing=True)
+                result = reserve_stock(product_id, user.id, quantity)
+
+            if result == RESERVE_SOLD_OUT:
+                mark_sold_out(product_id)
+                return jsonify({"status": "failed", "reason": "Sold out"}), 200
+            if result == RESERVE_INSUFFICIENT:
+                return jsonify({"status": "failed", "reason": "Insufficient stock"}), 200
+            if result == RESERVE_LIMIT_EXCEEDED:
+                return jsonify({"status": "failed", "reason": "Purchase limit exceeded"}), 200
+            reserved = result == RESERVE_OK
+        except redis.exceptions.RedisError as e:
+            print(f"Redis库存预扣失败: {e}, 将跳过预扣")
 
     # 基础验证
     product = Product.query.get(product_id)
     if not product:
+        if reserved:
+            release_stock(product_id, user.id, quantity)
         return jsonify({"error": "Product not found"}), 404
 
     # 将请求放入消息队列
-    if rabbitmq_channel:
-        for attempt in range(3):  # Retry up to 3 times
-            try:
-                # 检查通道是否关闭，如果是则重新连接
-                if rabbitmq_channel.is_closed:
-                    rabbitmq_channel = init_rabbitmq()
-                    
-                rabbitmq_channel.basic_publish(
-                    exchange='',
-                    routing_key='flash_sale_queue',
-                    body=json.dumps({
-                        'user_id': user.id,
-                        'product_id': product_id,
-                        'quantity': quantity,
-                        'total_amount': product.price * quantity,
-                    }),
-                    properties=pika.BasicProperties(
-                        delivery_mode=2,
-                    )
-                )
-                return jsonify({"message": "Request received, processing..."}), 202
-            except (pika.exceptions.AMQPConnectionError, 
-                   pika.exceptions.StreamLostError) as e:
-                print(f"RabbitMQ连接失败 (尝试 {attempt+1}/3): {e}")
-                if attempt < 2:  # Not last attempt
-                    time.sleep(1)  # Wait before retry
-                    rabbitmq_channel = init_rabbitmq()  # Reconnect
-                    continue
-                print("RabbitMQ重试失败，将使用直接处理模式")
-                rabbitmq_channel = None
-                break
-            except Exception as e:
-                print(f"RabbitMQ发布失败: {e}, 将使用直接处理模式")
-                rabbitmq_channel = None
-                break
-    
+    if broker and broker.available():
+        ticket = new_ticket()
+        try:
+            # 先写入pending，避免消费者先写结果后被覆盖
+            save_result(ticket, RESULT_PENDING)
+            # 同一商品的消息始终进入同一分区队列
+            broker.publish(queue_for_product(product_id), json.dumps({
+                'ticket': ticket,
+                'user_id': user.id,
+                'product_id': product_id,
+                'quantity': quantity,
+                'total_amount': product.price * quantity,
+                'reserved': reserved,
+            }))
+            return jsonify({"message": "Request received, processing...", "ticket": ticket}), 202
+        except BrokerError as e:
+            print(f"{e}, 将使用直接处理模式")
+
     # RabbitMQ不可用时的直接处理逻辑
+    result = settle_flash_sale(user.id, product_id, quantity, reserved=reserved)
+
+    if result == SETTLE_SUCCESS:
+        return jsonify({"message": "Order created successfully"}), 201
+    if result == SETTLE_INVALID:
+        return jsonify({"error": "Invalid user or product"}), 400
+    if result in (SETTLE_SOLD_OUT, SETTLE_NO_BALANCE):
+        return jsonify({
+            "status": "failed",
+            "reason": "Insufficient stock or balance"
+        }), 200  # 修改为返回200状态码
+    return jsonify({"error": "Order processing failed"}), 500
+
+
+@flash_sale_bp.route('/flash_sale/result/<string:ticket>', methods=['GET'])
+@swag_from({
+    'summary': '查询秒杀抢购结果',
+    'parameters': [
+        {
+            'name': 'ticket',
+            'in': 'path',
+            'type': 'string',
+            'required': True,
+            'description': '/flash_sale 返回的抢购凭证号'
+        },
+        {
+            'name': 'wait',
+            'in': 'query',
+            'type': 'number',
+            'required': False,
+            'default': 0,
+            'description': '结果未出时最多等待的秒数（长轮询）'
+        }
+    ],
+    'responses': {
+        200: {
+            'description': 'status 为 pending、success、sold_out、insufficient_balance、invalid 或 error',
+            'examples': {
+                'application/json': {'ticket': '9f1c...', 'status': 'success'}
+            }
+        },
+        404: {'description': 'Ticket not found or expired'}
+    }
+})
+def flash_sale_result(ticket):
+    try:
+        wait = float(request.args.get('wait', 0))
+    except ValueError:
+        return jsonify({"error": "Invalid wait value"}), 400
+    wait = max(0.0, min(wait, FLASH_SALE_CONFIG['RESULT_MAX_WAIT']))
+
+    result = get_result(ticket, wait=wait)
+    if result is None:
+        return jsonify({"error": "Ticket not found or expired"}), 404
+    return jsonify(dict(result, ticket=ticket)), 200
+
+
+@flash_sale_bp.route('/flash_sale/stock/preload', methods=['POST'])
+@swag_from({
+    'summary': '预加载秒杀库存到Redis',
+    'parameters': [
+        {
+            'name': 'Authorization',
+            'in': 'header',
+            'type': 'string',
+            'required': True,
+            'description': 'Admin token'
+        },
+        {
+            'name': 'body',
+            'in': 'body',
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'product_ids': {'type': 'array', 'items': {'type': 'integer'}}
+                },
+                'required': ['product_ids']
+            }
+        }
+    ],
+    'responses': {
+        200: {'description': 'Stock preloaded'},
+        403: {'description': 'Unauthorized access'},
+        503: {'description': 'Stock gate disabled'}
+    }
+})
+def preload_flash_sale_stock():
+    admin_check = check_admin_role(extract_token(request))
+    if admin_check:
+        return admin_check
+
+    if not stock_gate_enabled():
+        return jsonify({"error": "Stock gate disabled"}), 503
+
+    product_ids = (request.json or {}).get('product_ids') or []
+    products = Product.query.filter(Product.id.in_(product_ids)).all() if product_ids else []
     try:
-        with order_lock:
-            user = User.query.get(user.id)
-            product = Product.query.get(product_id)
+        for product in products:
+            load_stock(product.id, product.stock)
+    except redis.exceptions.RedisError as e:
+        return jsonify({"error": "Failed to preload stock", "details": str(e)}), 500
+
+    return jsonify({
+        "message": "Stock preloaded",
+        "products": {product.id: product.stock for product in products}
+    }), 200
+
+@flash_sale_bp.route('/flash_sale/broker/stats', methods=['GET'])
+@swag_from({
+    'summary': '查询消息代理状态（发布通道池占用、队列长度等）',
+    'parameters': [
+        {
+            'name': 'Authorization',
+            'in': 'header',
+            'type': 'string',
+            'required': True,
+            'description': 'Admin token'
+        }
+    ],
+    'responses': {
+        200: {'description': 'Broker metrics'},
+        403: {'description': 'Unauthorized access'},
+        503: {'description': 'Broker unavailable'}
+    }
+})
+def broker_stats():
+    admin_check = check_admin_role(extract_token(request))
+    if admin_check:
+        return admin_check
 
-            if not user or not product:
-                return jsonify({"error": "Invalid user or product"}), 400
+    if broker is None:
+        return jsonify({"error": "Broker unavailable"}), 503
 
-            # 封装计算 total_amount 的函数
-            def calculate_total_amount(product, quantity):
-                # 示例实现，根据实际情况修改
-                return product.price * quantity
-           
-            total_amount = calculate_total_amount(product, quantity)
+    lag = {}
+    dead_letters = {}
+    for queue in all_queues():
+        for name, depths in ((queue, lag), (dead_letter_queue(queue), dead_letters)):
+            try:
+                depths[name] = broker.queue_depth(name)
+            except BrokerError:
+                depths[name] = None
+    return jsonify(dict(broker.stats(), lag=lag, dead_letters=dead_letters)), 200
 
-            if user.balance < total_amount or product.stock < quantity:
-                return jsonify({
-                    "status": "failed",
-                    "reason": "Insufficient stock or balance"
-                }), 200  # 修改为返回200状态码
 
-            # 执行订单创建
-            with db.session.begin_nested():
-                user.balance -= total_amount
-                product.stock -= quantity
-                new_order = Order(product_id=product.id, user_id=user.id, quantity=quantity)
-                db.session.add(new_order)
-                flash_sale_order = FlashSaleOrder(
-                    product_id=product.id,
-                    user_id=user.id,
-                    amount=total_amount,
-                    purchase_time=datetime.utcnow()
-                )
-                db.session.add(flash_sale_order)
-            db.session.commit()
-            return jsonify({"message": "Order created successfully"}), 201
+def start_consumers():
+    """
+    启动内嵌消费线程
+    多分区时每个分区一个线程，保证同一商品按顺序处理；单分区时进程内队列按线程池方式启动多个消费线程
+    """
+    def run(queue):
+        from app import create_app  # 导入create_app函数
+        app = create_app()  # 每个消费线程只创建一次应用实例
+        run_consumer(app, broker, queue)
+
+    queues = all_queues()
+    if len(queues) == 1:
+        if broker.name == 'memory':
+            queues = queues * MESSAGE_BROKER_CONFIG['MEMORY_WORKERS']
+        else:
+            queues = queues * MESSAGE_BROKER_CONFIG['CONSUMER_THREADS']
+    for index, queue in enumerate(queues):
+        threading.Thread(target=run, args=(queue,), name=f'flash-sale-consumer-{index}', daemon=True).start()
+    print(f"消息消费线程已启动: {broker.name} x {len(queues)}")
 
-    except (DatabaseError, IntegrityError, Exception) as e:  # 合并异常捕获
-        db.session.rollback()
-        return jsonify({"error": "Order processing failed", "details": str(e)}), 500
 
 # 修改消费者线程启动逻辑
-if rabbitmq_channel is not None:
-    consumer_thread = threading.Thread(target=process_flash_sale, daemon=True)
-    consumer_thread.start()
-    print("RabbitMQ消费者线程已启动")
+if broker is None:
+    print("消息代理不可用，跳过消费者线程启动")
+elif not MESSAGE_BROKER_CONFIG['EMBEDDED_CONSUMERS']:
+    print("内嵌消费线程已关闭，请使用 python -m services.consumer_supervisor 启动消费进程")
 else:
-    print("RabbitMQ不可用，跳过消费者线程启动")
\ No newline at end of file
+    start_consumers()
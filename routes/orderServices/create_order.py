@@ -1,7 +1,9 @@
 from flask import Blueprint, request, jsonify
 from flasgger import swag_from
-from models import db, User, Product, Order, Cart
+from models import db, User, Cart
 from plugin.auth import extract_token
+from plugin.id_generator import new_order_id
+from services.order_service import create_cart_order, InsufficientStock
 
 create_order_bp = Blueprint('create_order', __name__)
 
@@ -50,29 +52,14 @@ def create_order():
         return jsonify({"error": "Invalid cart or user does not own this cart"}), 400
 
     try:
-        total_amount = 0
-
-        # 遍历购物车项目，计算总金额并创建订单项
-        for cart_item in cart.cart_items:
-            product = Product.query.get(cart_item.product_id)
-
-            if not product or product.stock < cart_item.quantity:
-                return jsonify({"error": f"Insufficient stock for product {product.id}"}), 400
-
-            total_amount += product.price * cart_item.quantity
-
-            # 减少库存
-            product.stock -= cart_item.quantity
-
-            # 创建订单项
-            new_order = Order(product_id=product.id, user_id=user.id, quantity=cart_item.quantity,
-                              product_price=product.price, main_order_id=f"main_{cart_id}")
-            db.session.add(new_order)
-
-        db.session.commit()  # 提交事务
-
-        return jsonify({"message": "Order created successfully", "main_order_id": f"main_{cart_id}"}), 201
+        main_order_id = new_order_id()
+        # 集合式下单：一次加锁、一条批量扣减、一条批量插入，查询次数与购物车商品数无关
+        create_cart_order(user.id, cart.id, main_order_id)
+        return jsonify({"message": "Order created successfully", "main_order_id": main_order_id}), 201
 
+    except InsufficientStock as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         db.session.rollback()  # 回滚事务
         return jsonify({"error": "Failed to create order", "details": str(e)}), 500
@@ -1,8 +1,10 @@
 from flask import Blueprint, jsonify, request
 from plugin.auth import extract_token
 from models import db, User, Order, Cart, CartItem, GetOrder, Product
-from plugin.response import success, error
+from plugin.response import success, error, make_etag, conditional_response
 from flasgger import swag_from
+from sqlalchemy import select
+from plugin.order_cache import get_cached_order, cache_order
 
 get_order_bp = Blueprint('get_order', __name__)
 
@@ -73,12 +75,18 @@ def get_order_detail(main_order_id):
         return jsonify({"error": "Invalid token or user not found"}), 404
     try:
         order_service = OrderService()
-        order_data = order_service.get_order_detail(main_order_id)
-        
-        if not order_data:
+        # 先用订单行的状态字段计算ETag，客户端已有最新数据时直接返回304，不再查询商品、构建订单详情
+        etag = order_service.get_order_etag(main_order_id)
+        if etag is None:
             return error(msg='订单不存在')
-            
-        return success(data=order_data)
+
+        def build():
+            order_data = order_service.get_order_detail(main_order_id)
+            if not order_data:
+                return error(msg='订单不存在')
+            return success(data=order_data)
+
+        return conditional_response(etag, build)
     except Exception as e:
         return error(msg=str(e))
     
@@ -86,47 +94,65 @@ def get_order_detail(main_order_id):
     # ... existing code ...
 
 class OrderService:
+    def get_order_etag(self, main_order_id):
+        """由订单各行的状态、支付状态、数量和价格计算ETag，订单不存在时返回None"""
+        rows = db.session.query(
+            Order.id, Order.user_id, Order.product_id, Order.quantity,
+            Order.product_price, Order.status, Order.payment_status
+        ).filter(Order.main_order_id == main_order_id).order_by(Order.id).all()
+        if not rows:
+            return None
+        return make_etag(main_order_id, [tuple(row) for row in rows])
+
     def get_order_detail(self, main_order_id):
-        """获取订单详情"""
-        # 查询订单基本信息
-        order = Order.query.filter_by(main_order_id=main_order_id).first()
-        if not order:
+        """
+        获取订单详情，先读缓存，未命中时用一条 订单-商品-用户 联表查询组装，查询次数与订单商品数无关
+        """
+        order_data = get_cached_order(main_order_id)
+        if order_data is not None:
+            return order_data
+
+        rows = db.session.execute(
+            select(
+                Order.user_id, User.username, Order.product_id, Product.name,
+                Order.product_price, Order.quantity, Order.created_at, Order.status
+            )
+            .join(User, User.id == Order.user_id)
+            .outerjoin(Product, Product.id == Order.product_id)
+            .where(Order.main_order_id == main_order_id)
+            .order_by(Order.id)
+        ).all()
+        if not rows:
             return None
-        
-        # 查询订单关联的用户信息
-        user = User.query.get(order.user_id)
-        
-        # 查询订单商品信息
-        order_items = Order.query.filter_by(main_order_id=main_order_id).all()
-        
-        # 构建商品列表并计算总金额
+
+        # 构建商品列表并计算总金额，商品已被删除的订单行不计入
         products = []
         total_amount = 0
-        for item in order_items:
-            product = Product.query.get(item.product_id)
-            if product:
-                subtotal = float(item.product_price * item.quantity)
-                total_amount += subtotal
-                product_info = {
-                    'product_id': item.product_id,
-                    'name': product.name,
-                    'price': float(item.product_price),
-                    'quantity': item.quantity,
-                    'subtotal': subtotal
-                }
-                products.append(product_info)
-        
-        # 构建返回数据
+        for _, _, product_id, name, price, quantity, _, _ in rows:
+            if name is None:
+                continue
+            subtotal = float(price * quantity)
+            total_amount += subtotal
+            products.append({
+                'product_id': product_id,
+                'name': name,
+                'price': float(price),
+                'quantity': quantity,
+                'subtotal': subtotal
+            })
+
+        # 订单基本信息取第一条订单行
+        user_id, username, _, _, _, _, created_at, status = rows[0]
         order_data = {
-            'main_order_id': order.main_order_id,
-            'total_amount': total_amount,  # 使用计算得到的总金额
+            'main_order_id': main_order_id,
+            'total_amount': total_amount,
             'user': {
-                'user_id': user.id,
-                'username': user.username
+                'user_id': user_id,
+                'username': username
             },
             'products': products,
-            'create_time': order.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-            'status': order.status
+            'create_time': created_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'status': status
         }
-        
-        return order_data
\ No newline at end of file
+        cache_order(main_order_id, order_data)
+        return order_data
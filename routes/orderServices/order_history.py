@@ -0,0 +1,95 @@
+from flask import Blueprint, request, jsonify
+from flasgger import swag_from
+from models import db, User
+from plugin.auth import extract_token
+from services.order_service import get_order_history, HISTORY_STATUSES, InvalidCursor
+from config import ORDER_HISTORY_CONFIG
+
+order_history_bp = Blueprint('order_history', __name__)
+
+
+@order_history_bp.route('/api/v1/orders', methods=['GET'])
+@swag_from({
+    'tags': ['订单管理'],
+    'summary': '分页查询订单历史',
+    'description': '按下单时间倒序返回当前用户的订单行，使用游标分页：把上一页返回的 next_cursor 作为 cursor 传入获取下一页，'
+                   'next_cursor 为 null 表示没有更多数据',
+    'parameters': [
+        {
+            'name': 'Authorization',
+            'in': 'header',
+            'type': 'string',
+            'required': True,
+            'description': '登录token'
+        },
+        {
+            'name': 'status',
+            'in': 'query',
+            'type': 'string',
+            'enum': ['all', 'pending', 'paid'],
+            'required': False,
+            'default': 'all',
+            'description': '支付状态筛选：all 全部，pending 待支付，paid 已支付'
+        },
+        {
+            'name': 'cursor',
+            'in': 'query',
+            'type': 'string',
+            'required': False,
+            'description': '上一页返回的 next_cursor，不传表示第一页'
+        },
+        {
+            'name': 'limit',
+            'in': 'query',
+            'type': 'integer',
+            'required': False,
+            'default': 20,
+            'description': '每页订单行数，最大100'
+        }
+    ],
+    'responses': {
+        200: {
+            'description': '订单历史',
+            'examples': {
+                'application/json': {
+                    'orders': [
+                        {
+                            'order_id': 12,
+                            'main_order_id': '0A8RQB9F80M00',
+                            'product_id': 3,
+                            'product_name': '华为手机',
+                            'quantity': 1,
+                            'price': 3999.0,
+                            'total_price': 3999.0,
+                            'status': 0,
+                            'payment_status': 1,
+                            'created_at': '2026-10-18 10:00:00'
+                        }
+                    ],
+                    'next_cursor': 'MjAyNi0xMC0xOFQxMDowMDowMHwxMg'
+                }
+            }
+        },
+        400: {'description': '参数错误'},
+        404: {'description': 'Invalid token or user not found'}
+    }
+})
+def list_orders():
+    token = extract_token(request)
+    user_id = db.session.query(User.id).filter_by(token=token).scalar()
+    if user_id is None:
+        return jsonify({"error": "Invalid token or user not found"}), 404
+
+    status = request.args.get('status', 'all')
+    if status not in HISTORY_STATUSES:
+        return jsonify({"error": "status只能是 all、pending 或 paid"}), 400
+    limit = request.args.get('limit', ORDER_HISTORY_CONFIG['DEFAULT_LIMIT'], type=int)
+    limit = max(1, min(limit, ORDER_HISTORY_CONFIG['MAX_LIMIT']))
+
+    try:
+        orders, next_cursor = get_order_history(
+            user_id, HISTORY_STATUSES[status], request.args.get('cursor'), limit
+        )
+    except InvalidCursor:
+        return jsonify({"error": "无效的cursor"}), 400
+    return jsonify({"orders": orders, "next_cursor": next_cursor}), 200
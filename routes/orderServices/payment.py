@@ -1,8 +1,10 @@
 from flask import Blueprint, request, jsonify
-from models import db, User, Order
+from models import db, User
 from flasgger import swag_from
 
 from plugin.auth import extract_token
+from plugin import idempotency
+from services.payment_service import pay_order, PAY_SUCCESS, PAY_NOT_FOUND, PAY_ALREADY_PAID
 
 payment_bp = Blueprint('payment', __name__)
 
@@ -17,6 +19,13 @@ payment_bp = Blueprint('payment', __name__)
             'type': 'string',
             'required': True,
         },
+        {
+            'name': 'Idempotency-Key',
+            'in': 'header',
+            'type': 'string',
+            'required': False,
+            'description': '客户端生成的唯一键，重复提交同一个键时直接返回第一次的支付结果，不会重复扣款'
+        },
         {
             'name': 'body',
             'in': 'body',
@@ -34,50 +43,52 @@ payment_bp = Blueprint('payment', __name__)
         200: {'description': 'Payment successful'},
         400: {'description': 'Invalid token or insufficient balance'},
         404: {'description': 'Order not found'},
+        409: {'description': 'Order already paid, or a request with the same Idempotency-Key is in progress'},
+        422: {'description': 'Idempotency-Key was already used for a different order'},
         500: {'description': 'Payment failed'}
     }
 })
 def pay():
-    data = request.json
+    data = request.get_json(silent=True) or {}
     main_order_id = data.get('main_order_id')
-    print("=============",main_order_id)
     if not main_order_id:
         return jsonify({"error": "Main Order ID is required"}), 400
 
     token = extract_token(request)
-    user = User.query.filter_by(token=token).first()
-
-    if not user:
+    user_id = db.session.query(User.id).filter_by(token=token).scalar()
+    if user_id is None:
         return jsonify({"error": "Invalid token"}), 400
 
-    # 获取所有子订单
-    orders = Order.query.filter_by(main_order_id=main_order_id, user_id=user.id).all()
-
-    if not orders:
-        return jsonify({"error": "订单未找到"}), 404
-
-    total_amount = sum(order.product_price * order.quantity for order in orders)
-
-    if user.balance < total_amount:
-        return jsonify({"error": "余额不足"}), 400
+    key = request.headers.get(idempotency.IDEMPOTENCY_HEADER)
+    if key is not None:
+        key = key.strip()
+        if not key or len(key) > idempotency.KEY_MAX_LENGTH:
+            return jsonify({"error": f"Idempotency-Key长度应为1-{idempotency.KEY_MAX_LENGTH}"}), 400
+        state, stored = idempotency.begin('pay', user_id, key, main_order_id)
+        if state == idempotency.IDEMPOTENCY_DONE:
+            return jsonify(stored[1]), stored[0]
+        if state == idempotency.IDEMPOTENCY_PENDING:
+            return jsonify({"error": "相同Idempotency-Key的支付请求正在处理"}), 409
+        if state == idempotency.IDEMPOTENCY_MISMATCH:
+            return jsonify({"error": "Idempotency-Key已用于其他订单"}), 422
 
     try:
-        # 手动管理事务，确保没有嵌套事务冲突
-        with db.session.no_autoflush:  # 暂时不提交数据到数据库
-            user.balance -= total_amount  # 扣除用户余额
-
-            # 更新所有订单的支付状态为已支付
-            for order in orders:
-                order.payment_status = 1  # 设置支付状态为已支付
-
-        # 手动刷新会话中的所有更改
-        db.session.flush()
-
-        # 提交事务
-        db.session.commit()
-
-        return jsonify({"message": "Payment successful", "main_order_id": main_order_id}), 200
-
+        result, total_amount = pay_order(user_id, main_order_id)
     except Exception as e:
-        db.session.rollback()  # 发生错误时回滚事务
+        db.session.rollback()
+        if key:
+            idempotency.release('pay', user_id, key)
         return jsonify({"error": "Payment failed", "details": str(e)}), 500
+
+    if result == PAY_SUCCESS:
+        body, code = {"message": "Payment successful", "main_order_id": main_order_id, "amount": total_amount}, 200
+    elif result == PAY_NOT_FOUND:
+        body, code = {"error": "订单未找到"}, 404
+    elif result == PAY_ALREADY_PAID:
+        body, code = {"error": "订单已支付", "main_order_id": main_order_id}, 409
+    else:
+        body, code = {"error": "余额不足"}, 400
+
+    if key:
+        idempotency.finish('pay', user_id, key, main_order_id, code, body)
+    return jsonify(body), code
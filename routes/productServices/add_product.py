@@ -2,6 +2,9 @@ from flask import Blueprint, request, jsonify
 from models import Product
 from db import db
 from flasgger import swag_from
+from plugin.product_filter import register_product, update_stock_state
+from plugin.catalog_cache import bump_catalog_version, adjust_product_count, cache_product
+from plugin.product_search import index_product
 
 add_product_bp = Blueprint('add_product', __name__)
 
@@ -52,5 +55,11 @@ def add_product():
 
     db.session.add(new_product)
     db.session.commit()
+    register_product(new_product.id)
+    update_stock_state(new_product.id, new_product.stock)
+    bump_catalog_version()
+    adjust_product_count(1)
+    cache_product(new_product)
+    index_product(new_product)
 
     return jsonify({"message": "Product added successfully!"}), 201
@@ -0,0 +1,130 @@
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+from flasgger import swag_from
+from plugin.auth import check_admin_role, extract_token
+from services.product_bulk_service import (
+    iter_records, import_products, export_products, FORMAT_NDJSON, FORMAT_CSV
+)
+
+bulk_products_bp = Blueprint('bulk_products', __name__)
+
+MIMETYPES = {
+    FORMAT_NDJSON: 'application/x-ndjson',
+    FORMAT_CSV: 'text/csv'
+}
+
+
+def request_format():
+    """优先使用 format 参数，其次按 Content-Type 判断，默认NDJSON"""
+    fmt = request.args.get('format')
+    if fmt:
+        return fmt.lower()
+    if 'csv' in (request.content_type or ''):
+        return FORMAT_CSV
+    return FORMAT_NDJSON
+
+
+@bulk_products_bp.route('/product_services/products/import', methods=['POST'])
+@swag_from({
+    'summary': '批量导入商品',
+    'tags': ['商品管理服务'],
+    'description': '流式读取NDJSON（每行一个 {"name", "price", "stock"} 对象）或带表头的CSV，'
+                   '分批插入数据库，返回逐行错误报告',
+    'consumes': ['application/x-ndjson', 'text/csv'],
+    'parameters': [
+        {
+            'name': 'Authorization',
+            'in': 'header',
+            'type': 'string',
+            'required': True,
+            'description': 'Admin token'
+        },
+        {
+            'name': 'format',
+            'in': 'query',
+            'type': 'string',
+            'enum': ['ndjson', 'csv'],
+            'required': False,
+            'description': '请求体格式，不传时按Content-Type判断'
+        },
+        {
+            'name': 'body',
+            'in': 'body',
+            'required': True,
+            'schema': {'type': 'string'}
+        }
+    ],
+    'responses': {
+        200: {
+            'description': '导入完成',
+            'examples': {
+                'application/json': {
+                    'inserted': 99998,
+                    'failed': 2,
+                    'errors': [
+                        {'line': 17, 'error': 'price或stock格式错误'},
+                        {'line': 2048, 'error': 'name不能为空'}
+                    ],
+                    'errors_truncated': False,
+                    'aborted': False
+                }
+            }
+        },
+        400: {'description': '不支持的格式，或请求体中途无法解析（返回已导入部分的报告，aborted为true）'},
+        403: {'description': 'Unauthorized access'}
+    }
+})
+def import_products_route():
+    admin_check = check_admin_role(extract_token(request))
+    if admin_check:
+        return admin_check
+
+    fmt = request_format()
+    if fmt not in MIMETYPES:
+        return jsonify({"error": f"不支持的格式: {fmt}"}), 400
+
+    report = import_products(iter_records(request.stream, fmt))
+    # 中途无法解析时之前的批次已提交，同样返回导入报告
+    return jsonify(report.to_dict()), 400 if report.aborted else 200
+
+
+@bulk_products_bp.route('/product_services/products/export', methods=['GET'])
+@swag_from({
+    'summary': '导出全部商品',
+    'tags': ['商品管理服务'],
+    'description': '按商品ID顺序流式导出，数据库使用服务端游标逐批读取',
+    'produces': ['application/x-ndjson', 'text/csv'],
+    'parameters': [
+        {
+            'name': 'Authorization',
+            'in': 'header',
+            'type': 'string',
+            'required': True,
+            'description': 'Admin token'
+        },
+        {
+            'name': 'format',
+            'in': 'query',
+            'type': 'string',
+            'enum': ['ndjson', 'csv'],
+            'required': False,
+            'default': 'ndjson'
+        }
+    ],
+    'responses': {
+        200: {'description': '商品数据流'},
+        400: {'description': '不支持的格式'},
+        403: {'description': 'Unauthorized access'}
+    }
+})
+def export_products_route():
+    admin_check = check_admin_role(extract_token(request))
+    if admin_check:
+        return admin_check
+
+    fmt = request.args.get('format', FORMAT_NDJSON).lower()
+    if fmt not in MIMETYPES:
+        return jsonify({"error": f"不支持的格式: {fmt}"}), 400
+
+    response = Response(stream_with_context(export_products(fmt)), mimetype=MIMETYPES[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename=products.{fmt}'
+    return response
@@ -1,6 +1,9 @@
 from flask import Blueprint, request, jsonify
-from models import db, Product
+from models import db, Product, ProductStockShard
 from flasgger import swag_from
+from plugin.product_filter import unregister_product
+from plugin.catalog_cache import bump_catalog_version, adjust_product_count, evict_products
+from plugin.product_search import unindex_product
 
 delete_product_bp = Blueprint('delete_product', __name__)
 
@@ -53,8 +56,14 @@ def delete_product(product_id):
         return jsonify({"error": "商品未找到"}), 404
 
     try:
+        ProductStockShard.query.filter_by(product_id=product_id).delete()
         db.session.delete(product)
         db.session.commit()
+        unregister_product(product_id)
+        bump_catalog_version()
+        adjust_product_count(-1)
+        evict_products([product_id])
+        unindex_product(product_id)
         return jsonify({"message": "商品删除成功"}), 200
     except Exception as e:
         db.session.rollback()
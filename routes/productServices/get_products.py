@@ -1,9 +1,14 @@
-from flask import Blueprint, jsonify, request, make_response
+from flask import Blueprint, jsonify, request, make_response, Response, stream_with_context
 from flasgger import swag_from
 from models import Product
 import time
 from db import db
 from utils.redis_util import redis_client  # 从工具类导入
+from plugin.catalog_cache import catalog_version, catalog_key, product_count, product_cache, get_cached_products
+from plugin.product_filter import product_filter
+from plugin.response import make_etag, bytes_etag, conditional_response
+from services.product_bulk_service import stream_products
+from config import BULK_PRODUCT_CONFIG
 from math import ceil
 
 # 删除所有Redis初始化相关代码，直接使用导入的redis_client
@@ -23,6 +28,13 @@ get_products_bp = Blueprint('get_products', __name__)
             'required': False,
             'description': '商品ID，查询单个商品时使用'
         },
+        {
+            'name': 'ids',
+            'in': 'query',
+            'type': 'string',
+            'required': False,
+            'description': '逗号分隔的商品ID，批量查询商品时使用，最多100个，例如 1,2,3'
+        },
         {
             'name': 'limit',
             'in': 'query',
@@ -38,6 +50,13 @@ get_products_bp = Blueprint('get_products', __name__)
             'required': False,
             'default': 1,
             'description': '页码，从1开始'
+        },
+        {
+            'name': 'after_id',
+            'in': 'query',
+            'type': 'integer',
+            'required': False,
+            'description': '游标分页：返回ID大于该值的商品，首页传0，后续页传上一页返回的next_cursor'
         }
     ],
     'responses': {
@@ -50,6 +69,17 @@ get_products_bp = Blueprint('get_products', __name__)
                     'price': 10.0,
                     'stock': 100
                 },
+                '批量商品': {
+                    'products': [
+                        {
+                            'id': 1,
+                            'name': '商品1',
+                            'price': 10.0,
+                            'stock': 100
+                        }
+                    ],
+                    'missing': [3]
+                },
                 '分页商品': {
                     'products': [
                         {
@@ -67,6 +97,18 @@ get_products_bp = Blueprint('get_products', __name__)
                     ],
                     'total_pages': 5,
                     'current_page': 1
+                },
+                '游标分页': {
+                    'products': [
+                        {
+                            'id': 11,
+                            'name': '商品11',
+                            'price': 10.0,
+                            'stock': 100
+                        }
+                    ],
+                    'next_cursor': 11,
+                    'total': 42
                 }
             }
         },
@@ -88,13 +130,36 @@ get_products_bp = Blueprint('get_products', __name__)
 })
 def get_products():
     product_id = request.args.get('id')
+    ids = request.args.get('ids')
     limit = min(int(request.args.get('limit', 10)), 100)
     page = int(request.args.get('page', 1))
     offset = (page - 1) * limit
+    after_id = request.args.get('after_id', type=int)
     start_time = time.time()  # 将start_time定义移到函数开头
     
     print(f"分页参数 - limit: {limit}, page: {page}, offset: {offset}")
 
+    if ids:
+        try:
+            product_ids = list(dict.fromkeys(int(item) for item in ids.split(',') if item.strip()))
+        except ValueError:
+            return jsonify({"error": "ids参数格式错误"}), 400
+        if not product_ids or len(product_ids) > 100:
+            return jsonify({"error": "ids参数数量应为1到100个"}), 400
+
+        # 过滤器确认不存在的商品不回源数据库
+        lookup_ids = [item for item in product_ids if product_filter.exists(item) is not False]
+        found = get_cached_products(lookup_ids)
+        elapsed_time = time.time() - start_time
+        print(f"批量查询商品耗时: {elapsed_time} 秒")
+        products = [found[item] for item in product_ids if item in found]
+        missing = [item for item in product_ids if item not in found]
+        # ETag由商品字段直接计算，客户端数据未变化时返回304，不序列化响应体
+        return conditional_response(
+            make_etag('ids', [product_etag_part(item) for item in products], missing),
+            lambda: (jsonify({'products': products, 'missing': missing}), 200)
+        )
+
     if product_id:
         # 修改为完整的降级处理
         if not redis_client:
@@ -110,53 +175,57 @@ def get_products():
                 time.sleep(3) # 模拟耗时
                 elapsed_time = time.time() - start_time
                 print(f"降级查询单个商品耗时: {elapsed_time} 秒")
-                return jsonify(product_data), 200
+                return conditional_response(
+                    make_etag('product', product_etag_part(product_data)),
+                    lambda: (jsonify(product_data), 200)
+                )
             else:
                 elapsed_time = time.time() - start_time
                 print(f"降级查询未找到商品耗时: {elapsed_time} 秒")
                 return jsonify({"message": "商品未找到"}), 404
-        # 构建缓存键
-        cache_key = 'all_products'
         try:
-            # 尝试从 Redis 缓存中获取数据
-            cached_products = redis_client.get(cache_key)
-        except redis.exceptions.ConnectionError as e:
-            print(f"Redis 连接错误: {e}")
-            return jsonify({"message": "Redis 连接错误，请稍后重试"}), 500
-        if cached_products:
-            # 如果缓存存在，直接返回缓存数据
-            elapsed_time = time.time() - start_time  # 计算耗时
-            print(f"使用缓存查询所有商品耗时: {elapsed_time} 秒")
-            return jsonify(eval(cached_products.decode())), 200
-        else:
-            time.sleep(3)  # 模拟数据库查询耗时
-            products = Product.query.all()
-            response_data = [
-                {
+            product_id = int(product_id)
+        except ValueError:
+            return jsonify({"error": "id参数格式错误"}), 400
+        # 单个商品只读取该商品自己的缓存键
+        found = get_cached_products([product_id]) if product_filter.exists(product_id) is not False else {}
+        elapsed_time = time.time() - start_time  # 计算耗时
+        print(f"查询单个商品耗时: {elapsed_time} 秒")
+        if product_id not in found:
+            return jsonify({"message": "商品未找到"}), 404
+        return conditional_response(
+            make_etag('product', product_etag_part(found[product_id])),
+            lambda: (jsonify(found[product_id]), 200)
+        )
+    elif after_id is not None:
+        # 游标分页：按主键范围扫描，不使用OFFSET，翻到多深都只读取limit+1行
+        products = Product.query.filter(Product.id > after_id).order_by(Product.id).limit(limit + 1).all()
+        has_more = len(products) > limit
+        products = products[:limit]
+        next_cursor = products[-1].id if has_more else None
+        total = product_count()
+        elapsed_time = time.time() - start_time
+        print(f"游标分页查询耗时: {elapsed_time} 秒")
+        return conditional_response(
+            make_etag('after', [product_etag_part(product) for product in products], next_cursor, total),
+            lambda: (jsonify({
+                'products': [{
                     'id': product.id,
                     'name': product.name,
                     'price': product.price,
                     'stock': product.stock
-                } for product in products
-            ]
-            try:
-                # 将数据存入 Redis 缓存
-                redis_client.set(cache_key, str(response_data))
-            except redis.exceptions.ConnectionError as e:
-                print(f"Redis 连接错误: {e}")
-                return jsonify({"message": "Redis 连接错误，数据未缓存"}), 500
-            response = make_response(jsonify(response_data), 200)
-            response.headers['Content-Type'] = 'application/json; charset=utf-8'
-            elapsed_time = time.time() - start_time  # 计算耗时
-            print(f"未使用缓存查询所有商品耗时: {elapsed_time} 秒")
-            return response
+                } for product in products],
+                'next_cursor': next_cursor,
+                'total': total
+            }), 200)
+        )
     else:
         # 添加完整的降级处理并返回响应
         if not redis_client:
             print("缓存不可用，直接查询数据库")
             time.sleep(3)  # 保持与缓存逻辑一致的模拟耗时
-            products = Product.query.offset(offset).limit(limit).all()
-            total = Product.query.count()
+            products = Product.query.order_by(Product.id).offset(offset).limit(limit).all()
+            total = product_count()
             response_data = {
                 'products': [{
                     'id': product.id,
@@ -169,40 +238,86 @@ def get_products():
             }
             elapsed_time = time.time() - start_time
             print(f"降级分页查询耗时: {elapsed_time} 秒")
-            return jsonify(response_data), 200
-        
+            return conditional_response(
+                make_etag('page', response_data['products'], total, page),
+                lambda: (jsonify(response_data), 200)
+            )
+
         # 以下是正常的缓存处理流程
-        cache_key = f'products_page_{page}_limit_{limit}'
-        try:
-            cached_products = redis_client.get(cache_key)
-        except redis.exceptions.ConnectionError as e:
-            print(f"Redis 连接错误: {e}")
-            return jsonify({"message": "Redis 连接错误，请稍后重试"}), 500
+        cache_key = catalog_key(catalog_version(), 'page', page=page, limit=limit)
+        cached_products = product_cache.get(cache_key, lambda: load_products_page(page, limit))
+        elapsed_time = time.time() - start_time
+        print(f"分页查询耗时: {elapsed_time} 秒")
+        # 缓存中已是序列化好的JSON，直接对字节串计算ETag
+        return conditional_response(bytes_etag(cached_products), lambda: json_response(cached_products))
 
-        if cached_products:
-            # 如果缓存存在，直接返回缓存数据
-            elapsed_time = time.time() - start_time
-            print(f"使用缓存分页查询耗时: {elapsed_time} 秒")
-            return jsonify(eval(cached_products.decode())), 200
-        else:
-            time.sleep(3)
-            products = Product.query.offset(offset).limit(limit).all()
-            total = Product.query.count()
-            response_data = {
-                'products': [{
-                    'id': product.id,
-                    'name': product.name,
-                    'price': product.price,
-                    'stock': product.stock
-                } for product in products],
-                'total_pages': ceil(total / limit),
-                'current_page': page
+
+
+@get_products_bp.route('/product_services/products/stream', methods=['GET'])
+@swag_from({
+    'summary': '流式获取全部商品',
+    'tags': ['商品管理服务'],
+    'description': '按商品ID顺序分页读取数据库，以NDJSON（每行一个商品）流式返回，适合镜像同步和比价任务；'
+                   '中断后可用最后收到的商品ID作为after_id继续拉取',
+    'produces': ['application/x-ndjson'],
+    'parameters': [
+        {
+            'name': 'after_id',
+            'in': 'query',
+            'type': 'integer',
+            'required': False,
+            'default': 0,
+            'description': '从该商品ID之后开始'
+        },
+        {
+            'name': 'page_size',
+            'in': 'query',
+            'type': 'integer',
+            'required': False,
+            'description': '每次从数据库读取的行数，最大1000'
+        }
+    ],
+    'responses': {
+        200: {
+            'description': '商品数据流，每行一个JSON对象',
+            'examples': {
+                'application/x-ndjson': '{"id":1,"name":"商品1","price":10.0,"stock":100}\n'
+                                        '{"id":2,"name":"商品2","price":15.0,"stock":50}\n'
             }
-            try:
-                redis_client.setex(cache_key, 60, str(response_data))  # 缓存60秒
-            except redis.exceptions.ConnectionError as e:
-                print(f"Redis 连接错误: {e}")
-                return jsonify({"message": "Redis 连接错误，数据未缓存"}), 500
-            elapsed_time = time.time() - start_time
-            print(f"未使用缓存分页查询耗时: {elapsed_time} 秒")
-            return jsonify(response_data)
+        }
+    }
+})
+def stream_all_products():
+    after_id = max(request.args.get('after_id', 0, type=int), 0)
+    page_size = request.args.get('page_size', BULK_PRODUCT_CONFIG['EXPORT_CHUNK'], type=int)
+    page_size = max(1, min(page_size, BULK_PRODUCT_CONFIG['EXPORT_CHUNK']))
+    return Response(stream_with_context(stream_products(after_id, page_size)), mimetype='application/x-ndjson')
+
+def product_etag_part(product):
+    """参与ETag计算的商品字段，支持模型对象和字典"""
+    if isinstance(product, dict):
+        return product['id'], product['name'], product['price'], product['stock']
+    return product.id, product.name, product.price, product.stock
+
+
+def json_response(raw, status=200):
+    """直接以JSON字节串作为响应体"""
+    response = make_response(raw, status)
+    response.headers['Content-Type'] = 'application/json; charset=utf-8'
+    return response
+
+
+def load_products_page(page, limit):
+    time.sleep(3)
+    products = Product.query.order_by(Product.id).offset((page - 1) * limit).limit(limit).all()
+    total = product_count()
+    return {
+        'products': [{
+            'id': product.id,
+            'name': product.name,
+            'price': product.price,
+            'stock': product.stock
+        } for product in products],
+        'total_pages': ceil(total / limit),
+        'current_page': page
+    }
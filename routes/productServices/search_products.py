@@ -0,0 +1,55 @@
+from flask import Blueprint, request, jsonify
+from flasgger import swag_from
+from plugin.product_search import search_index, ensure_search_index
+from config import SEARCH_CONFIG
+
+search_products_bp = Blueprint('search_products', __name__)
+
+
+@search_products_bp.route('/product_services/products/search', methods=['GET'])
+@swag_from({
+    'summary': '按名称搜索商品',
+    'tags': ['商品管理服务'],
+    'description': '使用进程内倒排索引搜索商品名称，中文按字词、英文按词前缀匹配，结果按匹配程度和库存排序',
+    'parameters': [
+        {
+            'name': 'q',
+            'in': 'query',
+            'type': 'string',
+            'required': True,
+            'description': '搜索关键词，例如 手机 或 iphone'
+        },
+        {
+            'name': 'limit',
+            'in': 'query',
+            'type': 'integer',
+            'required': False,
+            'default': 20,
+            'description': '返回数量，最大100'
+        }
+    ],
+    'responses': {
+        200: {
+            'description': '搜索结果',
+            'examples': {
+                'application/json': {
+                    'products': [
+                        {'id': 2, 'name': '手机壳', 'price': 19.9, 'stock': 120},
+                        {'id': 1, 'name': '华为手机', 'price': 3999.0, 'stock': 0}
+                    ],
+                    'total': 2
+                }
+            }
+        },
+        400: {'description': '缺少搜索关键词'}
+    }
+})
+def search_products():
+    query = (request.args.get('q') or '').strip()
+    if not query:
+        return jsonify({"error": "缺少搜索关键词"}), 400
+    limit = max(1, min(request.args.get('limit', 20, type=int), SEARCH_CONFIG['MAX_LIMIT']))
+
+    ensure_search_index()
+    products, total = search_index.search(query, limit)
+    return jsonify({"products": products, "total": total}), 200
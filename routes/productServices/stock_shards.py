@@ -0,0 +1,110 @@
+from flask import Blueprint, request, jsonify
+from flasgger import swag_from
+from models import db, Product, ProductStockShard
+from plugin.auth import check_admin_role, extract_token
+from services.stock_shard_service import reset_shards, locked_shard_total
+from config import STOCK_SHARD_CONFIG
+
+stock_shards_bp = Blueprint('stock_shards', __name__)
+
+
+@stock_shards_bp.route('/product_services/stock_shards/<int:product_id>', methods=['GET'])
+@swag_from({
+    'summary': '查询商品库存分片',
+    'tags': ['商品管理服务'],
+    'parameters': [
+        {
+            'name': 'product_id',
+            'in': 'path',
+            'type': 'integer',
+            'required': True
+        },
+        {
+            'name': 'Authorization',
+            'in': 'header',
+            'type': 'string',
+            'required': True,
+            'description': 'Admin token'
+        }
+    ],
+    'responses': {
+        200: {'description': '分片库存'},
+        404: {'description': 'Product not found'}
+    }
+})
+def get_stock_shards(product_id):
+    admin_check = check_admin_role(extract_token(request))
+    if admin_check:
+        return admin_check
+
+    product = Product.query.get(product_id)
+    if not product:
+        return jsonify({"error": "Product not found"}), 404
+
+    shards = ProductStockShard.query.filter_by(product_id=product_id).order_by(ProductStockShard.shard_no).all()
+    return jsonify({
+        "product_id": product_id,
+        "stock": product.stock,
+        "shards": [{"shard_no": shard.shard_no, "stock": shard.stock} for shard in shards]
+    }), 200
+
+
+@stock_shards_bp.route('/product_services/stock_shards/<int:product_id>', methods=['POST'])
+@swag_from({
+    'summary': '开启或调整商品库存分片',
+    'tags': ['商品管理服务'],
+    'description': '把商品库存拆分到多个分片行，热门商品的并发扣减分散到不同行上；shards为0时合并回 Product.stock',
+    'parameters': [
+        {
+            'name': 'product_id',
+            'in': 'path',
+            'type': 'integer',
+            'required': True
+        },
+        {
+            'name': 'Authorization',
+            'in': 'header',
+            'type': 'string',
+            'required': True,
+            'description': 'Admin token'
+        },
+        {
+            'name': 'body',
+            'in': 'body',
+            'required': False,
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'shards': {'type': 'integer', 'example': 8}
+                }
+            }
+        }
+    ],
+    'responses': {
+        200: {'description': 'Stock shards updated'},
+        400: {'description': 'Invalid shard count'},
+        404: {'description': 'Product not found'}
+    }
+})
+def set_stock_shards(product_id):
+    admin_check = check_admin_role(extract_token(request))
+    if admin_check:
+        return admin_check
+
+    data = request.get_json(silent=True) or {}
+    shard_count = data.get('shards', STOCK_SHARD_CONFIG['DEFAULT_SHARDS'])
+    if not isinstance(shard_count, int) or shard_count < 0:
+        return jsonify({"error": "Invalid shard count"}), 400
+
+    try:
+        # 在同一事务内锁定现有分片并以加锁后的分片之和作为总库存，期间的扣减不会被加回
+        total = locked_shard_total(product_id)
+        if total is None:
+            db.session.rollback()
+            return jsonify({"error": "Product not found"}), 404
+        reset_shards(product_id, total, shard_count)
+        db.session.commit()
+        return jsonify({"message": "Stock shards updated", "shards": shard_count}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": "Failed to update stock shards", "details": str(e)}), 500
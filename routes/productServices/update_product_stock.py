@@ -4,6 +4,13 @@ from flask import Blueprint, request, jsonify
 from models import db, Product
 from flasgger import swag_from
 from plugin.auth import check_admin_role, extract_token  # 引入权限检查模块
+from services.stock_shard_service import lock_shards, reset_shards
+from plugin.product_filter import update_stock_state
+from plugin.catalog_cache import bump_catalog_version, set_cached_stock
+from plugin.product_search import update_indexed_stock
+from plugin.flash_sale_stock import invalidate_stock
+from services.stock_update_service import apply_stock_operations, refresh_stock_caches
+from config import BULK_PRODUCT_CONFIG
 
 update_product_stock_bp = Blueprint('update_product_stock', __name__)
 
@@ -93,9 +100,130 @@ def update_product_stock(product_id):
         return jsonify({"error": "Invalid stock value"}), 400
 
     try:
-        product.stock = new_stock
+        # 锁定商品行后按最新的分片标记处理，不依赖进程内缓存
+        _, shards = lock_shards(product.id)
+        if shards:
+            # 分片商品按新库存重新划分分片
+            reset_shards(product.id, new_stock)
+        else:
+            product.stock = new_stock
         db.session.commit()
+        # 删除秒杀预扣库存，下次抢购时从数据库懒加载新库存，避免旧的0库存把商品重新标记为售罄
+        invalidate_stock(product.id)
+        update_stock_state(product.id, new_stock)
+        bump_catalog_version()
+        set_cached_stock(product.id, new_stock)
+        update_indexed_stock(product.id, new_stock)
         return jsonify({"message": "Product stock updated successfully"}), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": "Failed to update product stock", "details": str(e)}), 500
+
+
+@update_product_stock_bp.route('/product_services/stock', methods=['PATCH'])
+@swag_from({
+    'summary': '批量增减或设置商品库存',
+    'tags': ['商品管理服务'],
+    'description': '每项操作二选一：delta 在数据库中原子增减库存，set 直接设置库存。'
+                   '全部操作在一个事务内执行，任一操作失败（商品不存在、库存将变为负数）时整批回滚。',
+    'parameters': [
+        {
+            'name': 'Authorization',
+            'in': 'header',
+            'type': 'string',
+            'required': True,
+            'description': 'Admin token'
+        },
+        {
+            'name': 'body',
+            'in': 'body',
+            'required': True,
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'operations': {
+                        'type': 'array',
+                        'items': {
+                            'type': 'object',
+                            'properties': {
+                                'product_id': {'type': 'integer', 'example': 1},
+                                'delta': {'type': 'integer', 'example': 50},
+                                'set': {'type': 'integer', 'example': 200}
+                            },
+                            'required': ['product_id']
+                        }
+                    }
+                },
+                'required': ['operations']
+            }
+        }
+    ],
+    'responses': {
+        200: {
+            'description': 'Stock updated',
+            'examples': {
+                'application/json': {
+                    'message': 'Product stock updated successfully',
+                    'stocks': {'1': 150, '2': 200}
+                }
+            }
+        },
+        400: {'description': 'Invalid operations'},
+        403: {'description': 'Unauthorized access'},
+        409: {
+            'description': 'Some operations failed, nothing was applied',
+            'examples': {
+                'application/json': {
+                    'error': 'Stock update rejected',
+                    'failures': [{'product_id': 3, 'delta': -10, 'error': 'negative_stock'}]
+                }
+            }
+        }
+    }
+})
+def patch_product_stock():
+    admin_check = check_admin_role(extract_token(request))
+    if admin_check:
+        return admin_check
+
+    operations = (request.json or {}).get('operations')
+    if not isinstance(operations, list) or not operations:
+        return jsonify({"error": "operations must be a non-empty list"}), 400
+    if len(operations) > BULK_PRODUCT_CONFIG['BATCH_SIZE']:
+        return jsonify({"error": f"At most {BULK_PRODUCT_CONFIG['BATCH_SIZE']} operations per request"}), 400
+
+    parsed = []
+    for index, operation in enumerate(operations):
+        error = validate_stock_operation(operation)
+        if error:
+            return jsonify({"error": error, "index": index}), 400
+        parsed.append({key: operation[key] for key in ('product_id', 'delta', 'set') if key in operation})
+
+    try:
+        stocks, failures = apply_stock_operations(parsed)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": "Failed to update product stock", "details": str(e)}), 500
+    if failures:
+        return jsonify({"error": "Stock update rejected", "failures": failures}), 409
+
+    refresh_stock_caches(parsed, stocks)
+    return jsonify({"message": "Product stock updated successfully", "stocks": stocks}), 200
+
+
+def validate_stock_operation(operation):
+    if not isinstance(operation, dict):
+        return "Each operation must be an object"
+    if not _is_int(operation.get('product_id')):
+        return "product_id must be an integer"
+    if ('delta' in operation) == ('set' in operation):
+        return "Each operation needs exactly one of delta or set"
+    if 'delta' in operation and not _is_int(operation['delta']):
+        return "delta must be an integer"
+    if 'set' in operation and (not _is_int(operation['set']) or operation['set'] < 0):
+        return "set must be a non-negative integer"
+    return None
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
@@ -0,0 +1,155 @@
+"""
+秒杀消费进程管理
+
+按分区启动多个消费进程，每个分区只由一个进程消费，同一商品的订单在进程内按顺序结算；
+进程异常退出后自动重启，并定期输出各分区的积压情况。
+
+启动方式（需在 config.MESSAGE_BROKER_CONFIG 中将 EMBEDDED_CONSUMERS 设为 False）:
+    python -m services.consumer_supervisor
+"""
+import multiprocessing
+import signal
+import socket
+import threading
+import time
+from config import MESSAGE_BROKER_CONFIG, RABBITMQ_CONFIG
+
+RESTART_BACKOFF_MAX = 30  # 连续崩溃时重启间隔的上限（秒）
+
+
+def worker_partitions(worker_index, workers, partitions):
+    """按取模把分区分配给消费进程"""
+    return [partition for partition in range(partitions) if partition % workers == worker_index]
+
+
+def create_worker_app():
+    """消费进程只需要数据库，不注册蓝图，避免导入路由模块时再启动内嵌消费线程"""
+    from flask import Flask
+    from db import db
+    from config import SQLALCHEMY_DATABASE_URI, SQLALCHEMY_TRACK_MODIFICATIONS, SQLALCHEMY_ENGINE_OPTIONS
+    app = Flask(__name__)
+    app.config.update({
+        'SQLALCHEMY_DATABASE_URI': SQLALCHEMY_DATABASE_URI,
+        'SQLALCHEMY_TRACK_MODIFICATIONS': SQLALCHEMY_TRACK_MODIFICATIONS,
+        'SQLALCHEMY_ENGINE_OPTIONS': SQLALCHEMY_ENGINE_OPTIONS
+    })
+    db.init_app(app)
+    return app
+
+
+def worker_main(worker_index, partitions):
+    """消费进程入口：每个分区一个消费线程"""
+    from utils.redis_util import redis_client
+    from plugin.message_broker import create_broker
+    from plugin.partitioner import partition_queue
+    from services.flash_sale_consumer import run_consumer
+
+    queues = [partition_queue(partition) for partition in partitions]
+    broker = create_broker(MESSAGE_BROKER_CONFIG, RABBITMQ_CONFIG, redis_client, queues)
+    if broker is None:
+        raise SystemExit(1)
+
+    app = create_worker_app()
+    # 每个分区只由一个进程消费，主机名加进程序号在重启前后保持不变
+    consumer_name = f"{socket.gethostname()}-worker-{worker_index}"
+    threads = [
+        threading.Thread(
+            target=run_consumer, args=(app, broker, queue, consumer_name), name=f'consumer-{queue}', daemon=True
+        )
+        for queue in queues
+    ]
+    for thread in threads:
+        thread.start()
+    print(f"消费进程 {worker_index} 已启动，分区: {partitions}")
+    for thread in threads:
+        thread.join()
+
+
+class ConsumerSupervisor:
+    def __init__(self, workers, partitions):
+        self.partitions = partitions
+        self.workers = min(workers, partitions)
+        # spawn方式启动，子进程不继承父进程的网络连接
+        self._context = multiprocessing.get_context('spawn')
+        self._processes = {}
+        self._restarts = {index: 0 for index in range(self.workers)}
+        self._next_start = {index: 0 for index in range(self.workers)}
+        self._stopping = False
+        self._broker = None
+
+    def start(self):
+        for index in range(self.workers):
+            self._spawn(index)
+
+    def stop(self, *args):
+        self._stopping = True
+        for process in self._processes.values():
+            if process.is_alive():
+                process.terminate()
+        for process in self._processes.values():
+            process.join(timeout=10)
+
+    def run_forever(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        self.start()
+        last_lag_report = time.time()
+        try:
+            while not self._stopping:
+                time.sleep(MESSAGE_BROKER_CONFIG['SUPERVISOR_CHECK_INTERVAL'])
+                self._check_workers()
+                if time.time() - last_lag_report >= MESSAGE_BROKER_CONFIG['SUPERVISOR_LAG_INTERVAL']:
+                    self.report_lag()
+                    last_lag_report = time.time()
+        except KeyboardInterrupt:
+            self.stop()
+
+    def lag(self):
+        """各分区积压的消息数，查询失败的分区为None"""
+        from utils.redis_util import redis_client
+        from plugin.message_broker import create_broker, BrokerError
+        from plugin.partitioner import partition_queue
+
+        if self._broker is None:
+            self._broker = create_broker(MESSAGE_BROKER_CONFIG, RABBITMQ_CONFIG, redis_client,
+                                         [partition_queue(partition) for partition in range(self.partitions)])
+        result = {}
+        for partition in range(self.partitions):
+            queue = partition_queue(partition)
+            try:
+                result[queue] = self._broker.queue_depth(queue) if self._broker else None
+            except BrokerError:
+                result[queue] = None
+        return result
+
+    def report_lag(self):
+        print(f"分区积压: {self.lag()}")
+
+    def _spawn(self, index):
+        partitions = worker_partitions(index, self.workers, self.partitions)
+        process = self._context.Process(
+            target=worker_main, args=(index, partitions), name=f'flash-sale-worker-{index}'
+        )
+        process.start()
+        self._processes[index] = process
+
+    def _check_workers(self):
+        now = time.time()
+        for index, process in list(self._processes.items()):
+            if process.is_alive() or now < self._next_start[index]:
+                continue
+            # 连续崩溃时按指数退避重启
+            self._restarts[index] += 1
+            backoff = min(2 ** min(self._restarts[index], 5), RESTART_BACKOFF_MAX)
+            print(f"消费进程 {index} 已退出(exitcode={process.exitcode})，第 {self._restarts[index]} 次重启")
+            self._next_start[index] = now + backoff
+            self._spawn(index)
+
+
+if __name__ == '__main__':
+    if MESSAGE_BROKER_CONFIG['BACKEND'] == 'memory':
+        raise SystemExit("进程内队列只能由Web进程内的消费线程处理，请使用 amqp 或 redis 后端")
+    supervisor = ConsumerSupervisor(
+        workers=MESSAGE_BROKER_CONFIG['SUPERVISOR_WORKERS'],
+        partitions=max(MESSAGE_BROKER_CONFIG['PARTITIONS'], 1)
+    )
+    supervisor.run_forever()
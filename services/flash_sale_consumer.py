@@ -0,0 +1,125 @@
+import json
+import time
+from config import FLASH_SALE_CONFIG, MESSAGE_BROKER_CONFIG
+from plugin.flash_sale_result import save_result
+from plugin.flash_sale_stock import release_stock
+from plugin.message_broker import BrokerError, dead_letter_queue
+from services.flash_sale_service import (
+    settle_flash_sale, settle_flash_sale_batch, SETTLE_SUCCESS, SETTLE_ERROR
+)
+
+REQUIRED_FIELDS = ('user_id', 'product_id', 'quantity')
+ATTEMPT_HEADER = 'x-attempt'  # 已处理次数
+REASON_HEADER = 'x-dead-reason'  # 进入死信队列的原因
+
+
+def run_consumer(app, broker, queue, consumer_name=None):
+    """
+    消费循环，与具体消息代理无关
+    批量模式一次结算一批消息，单条模式逐条结算；消费者断线后自动重建
+    :param consumer_name: 稳定的消费者名，重建或进程重启后沿用，redis后端据此重新投递自己名下未确认的消息
+    """
+    batch = FLASH_SALE_CONFIG['CONSUMER_MODE'] == 'batch'
+    batch_size = FLASH_SALE_CONFIG['BATCH_SIZE'] if batch else 1
+    while True:
+        try:
+            consumer = broker.consumer(queue, prefetch=batch_size, name=consumer_name)
+        except Exception as e:
+            print(f"创建消费者失败: {e}")
+            time.sleep(MESSAGE_BROKER_CONFIG['RECONNECT_INTERVAL'])
+            continue
+
+        print(f"开始消费消息队列 {queue} ({broker.name})...")
+        try:
+            while True:
+                deliveries = consumer.fetch(batch_size, FLASH_SALE_CONFIG['BATCH_WAIT'])
+                if deliveries:
+                    handle_deliveries(app, broker, consumer, queue, deliveries, batch)
+        except Exception as e:
+            print(f"消息消费错误: {e}, 将重建消费者")
+            consumer.close()
+            time.sleep(MESSAGE_BROKER_CONFIG['RECONNECT_INTERVAL'])
+
+
+def handle_deliveries(app, broker, consumer, queue, deliveries, batch=True):
+    """
+    结算一批消息并逐条确认
+    成功和业务拒绝（商品或用户不存在、库存不足、余额不足）写入结果后直接确认，不再重新入队；
+    数据库异常按退避时间延迟重试，超过最大次数后进入死信队列
+    """
+    messages = []
+    parsed = []
+    for delivery in deliveries:
+        try:
+            message = json.loads(delivery.body)
+            if any(field not in message for field in REQUIRED_FIELDS):
+                raise ValueError(f"缺少字段: {REQUIRED_FIELDS}")
+        except Exception as e:
+            print(f"消息解析失败: {e}")
+            dead_letter(broker, consumer, queue, delivery, 'malformed')
+            continue
+        messages.append(message)
+        parsed.append(delivery)
+
+    with app.app_context():
+        if batch:
+            results = settle_flash_sale_batch(messages, release_on_error=False)
+        else:
+            results = [
+                settle_flash_sale(message['user_id'], message['product_id'], message['quantity'],
+                                  reserved=message.get('reserved', False), release_on_error=False)
+                for message in messages
+            ]
+
+    for delivery, message, result in zip(parsed, messages, results):
+        if result == SETTLE_ERROR:
+            retry_or_dead_letter(broker, consumer, queue, delivery, message)
+            continue
+        save_result(message.get('ticket'), result)
+        consumer.ack(delivery)
+        if result != SETTLE_SUCCESS:
+            print(f"订单被拒绝: 用户 {message['user_id']} 商品 {message['product_id']} 原因 {result}")
+
+    if batch:
+        print(f"批量结算完成: {results.count(SETTLE_SUCCESS)}/{len(deliveries)} 条成功")
+
+
+def retry_delay(attempt):
+    """第attempt次重试前的等待秒数"""
+    delays = MESSAGE_BROKER_CONFIG['RETRY_DELAYS']
+    return delays[min(attempt, len(delays)) - 1]
+
+
+def retry_or_dead_letter(broker, consumer, queue, delivery, message):
+    attempt = int(delivery.headers.get(ATTEMPT_HEADER, 0)) + 1
+    if attempt >= MESSAGE_BROKER_CONFIG['MAX_ATTEMPTS']:
+        dead_letter(broker, consumer, queue, delivery, 'max_attempts', attempt)
+        save_result(message.get('ticket'), SETTLE_ERROR)
+        if message.get('reserved'):
+            release_stock(message['product_id'], message['user_id'], message['quantity'])
+        return
+
+    try:
+        broker.publish(queue, delivery.body, headers={ATTEMPT_HEADER: attempt}, delay=retry_delay(attempt))
+    except BrokerError as e:
+        # 重试消息发布失败时退回原队列，保证消息不丢
+        print(f"重试消息发布失败: {e}")
+        consumer.nack(delivery, requeue=True)
+        return
+    consumer.ack(delivery)
+    print(f"订单结算异常，{retry_delay(attempt)} 秒后第 {attempt} 次重试")
+
+
+def dead_letter(broker, consumer, queue, delivery, reason, attempt=None):
+    """把消息转入死信队列并确认原消息"""
+    headers = {REASON_HEADER: reason}
+    if attempt is not None:
+        headers[ATTEMPT_HEADER] = attempt
+    try:
+        broker.publish(dead_letter_queue(queue), delivery.body, headers=headers)
+    except BrokerError as e:
+        print(f"死信消息发布失败: {e}, 消息内容: {delivery.body!r}")
+        consumer.nack(delivery, requeue=False)
+        return
+    consumer.ack(delivery)
+    print(f"消息已转入死信队列 {dead_letter_queue(queue)}: {reason}")
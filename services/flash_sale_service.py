@@ -0,0 +1,222 @@
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import update
+from models import db, User, Product, Order, FlashSaleOrder
+from plugin.flash_sale_stock import release_stock
+from plugin.striped_lock import StripedLock
+from plugin.catalog_cache import adjust_cached_stock
+from services.stock_shard_service import (
+    get_shard_count, decrement_stock, decrement_shard_stock, restore_shard_stock,
+    remember_shard_count, forget_shard_count
+)
+
+# 结算结果
+SETTLE_SUCCESS = 'success'
+SETTLE_INVALID = 'invalid'  # 用户或商品不存在
+SETTLE_SOLD_OUT = 'sold_out'  # 库存不足
+SETTLE_NO_BALANCE = 'insufficient_balance'  # 余额不足
+SETTLE_ERROR = 'error'  # 数据库异常
+
+product_locks = StripedLock()  # 按商品ID分段的进程内锁，不同商品的订单互不阻塞
+
+
+def settle_flash_sale(user_id, product_id, quantity, reserved=False, release_on_error=True):
+    """
+    单条结算：用条件UPDATE扣减库存和余额，不在Python中读改写
+    语句顺序固定为先库存行后用户行，与批量结算的加锁顺序一致，避免死锁
+    :param release_on_error: 数据库异常时是否归还Redis预扣库存，会重试的调用方应传False
+    """
+    with product_locks.get(product_id):
+        try:
+            price = db.session.query(Product.price).filter(Product.id == product_id).scalar()
+            if price is None:
+                result = SETTLE_INVALID
+            else:
+                result = _settle_one(user_id, product_id, quantity, price)
+            if result == SETTLE_SUCCESS:
+                db.session.commit()
+                adjust_cached_stock({product_id: -quantity})
+            else:
+                db.session.rollback()
+        except Exception as e:
+            db.session.rollback()
+            print(f"订单结算失败: {e}")
+            result = SETTLE_ERROR
+
+    message = {'user_id': user_id, 'product_id': product_id, 'quantity': quantity, 'reserved': reserved}
+    _release_failed_reservations([message], [result], release_on_error)
+    return result
+
+
+def _settle_one(user_id, product_id, quantity, price):
+    total_amount = price * quantity
+
+    # 条件扣减库存：UPDATE ... SET stock = stock - :q WHERE ... AND stock >= :q
+    if not decrement_stock(product_id, quantity):
+        return SETTLE_SOLD_OUT
+
+    balance_updated = db.session.execute(
+        update(User)
+        .where(User.id == user_id, User.balance >= total_amount)
+        .values(balance=User.balance - total_amount)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not balance_updated:
+        user_exists = db.session.query(User.id).filter(User.id == user_id).scalar() is not None
+        return SETTLE_NO_BALANCE if user_exists else SETTLE_INVALID
+
+    now = datetime.utcnow()
+    db.session.execute(Order.__table__.insert(), [{
+        'product_id': product_id,
+        'user_id': user_id,
+        'quantity': quantity,
+        'product_price': price,
+        'created_at': now
+    }])
+    db.session.execute(FlashSaleOrder.__table__.insert(), [{
+        'product_id': product_id,
+        'user_id': user_id,
+        'amount': total_amount,
+        'purchase_time': now
+    }])
+    return SETTLE_SUCCESS
+
+
+def settle_flash_sale_batch(messages, release_on_error=True):
+    """
+    批量结算秒杀订单：一次加锁查询、一次批量插入、一次提交
+    :param messages: 已解析的消息列表，每项包含 user_id、product_id、quantity，可选 reserved
+    :param release_on_error: 数据库异常时是否归还Redis预扣库存，会重试的调用方应传False
+    :return: 与 messages 顺序一致的结算结果列表
+    """
+    if not messages:
+        return []
+
+    try:
+        results = _settle(messages)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        if len(messages) > 1:
+            # 整批失败时逐条重试，避免单条异常数据拖垮整批订单
+            print(f"批量结算失败: {e}, 改为逐条结算")
+            return [settle_flash_sale_batch([message], release_on_error)[0] for message in messages]
+        print(f"订单结算失败: {e}")
+        results = [SETTLE_ERROR]
+    else:
+        deltas = defaultdict(int)
+        for message, result in zip(messages, results):
+            if result == SETTLE_SUCCESS:
+                deltas[message['product_id']] -= message['quantity']
+        adjust_cached_stock(deltas)
+
+    _release_failed_reservations(messages, results, release_on_error)
+    return results
+
+
+def _settle(messages):
+    results = [None] * len(messages)
+    product_ids = sorted({message['product_id'] for message in messages})
+    user_ids = sorted({message['user_id'] for message in messages})
+    sharded_ids = [product_id for product_id in product_ids if get_shard_count(product_id)]
+    locked_ids = [product_id for product_id in product_ids if product_id not in sharded_ids]
+
+    # 固定加锁顺序：先库存行（商品行或分片行）后用户行，且均按ID升序，避免死锁
+    products = {}
+    shard_ranges = {}  # 本进程缓存未过期、实际已开启分片的商品 -> 全部分片号
+    if locked_ids:
+        products.update({
+            product.id: product for product in
+            Product.query.filter(Product.id.in_(locked_ids)).order_by(Product.id).with_for_update().populate_existing().all()
+        })
+        # 商品行已加锁，分片标记不会再变；本进程缓存过期前其他进程已开启分片的商品改为扣减分片
+        for product_id in locked_ids:
+            product = products.get(product_id)
+            if product is not None and product.shard_count:
+                remember_shard_count(product_id, product.shard_count)
+                # 事务快照可能早于开启分片，非加锁读看不到新分片，扣减时尝试全部分片
+                shard_ranges[product_id] = range(product.shard_count)
+        locked_ids = [product_id for product_id in locked_ids if product_id not in shard_ranges]
+        sharded_ids = sorted(sharded_ids + list(shard_ranges))
+    if sharded_ids:
+        # 分片商品只读价格，库存从分片中扣减，不锁热点商品行
+        products.update({
+            product.id: product for product in Product.query.filter(Product.id.in_(sharded_ids)).all()
+        })
+
+    # 按商品分组，组内保持消息到达顺序
+    groups = defaultdict(list)
+    for index, message in enumerate(messages):
+        groups[message['product_id']].append(index)
+
+    taken_shards = {}  # 消息下标 -> 已扣减的分片号
+    for product_id in sharded_ids:
+        for index in groups[product_id]:
+            shard_no = decrement_shard_stock(product_id, messages[index]['quantity'], shard_ranges.get(product_id))
+            if shard_no is None:
+                forget_shard_count(product_id)  # 分片可能已被取消，下次重新读取
+                results[index] = SETTLE_SOLD_OUT
+            else:
+                taken_shards[index] = shard_no
+
+    users = {
+        user.id: user for user in
+        User.query.filter(User.id.in_(user_ids)).order_by(User.id).with_for_update().all()
+    }
+
+    now = datetime.utcnow()
+    order_rows = []
+    flash_sale_rows = []
+    for product_id in product_ids:
+        product = products.get(product_id)
+        sharded = product_id in sharded_ids
+        for index in groups[product_id]:
+            if results[index] is not None:
+                continue
+            message = messages[index]
+            user = users.get(message['user_id'])
+            quantity = message['quantity']
+            if not product or not user:
+                results[index] = SETTLE_INVALID
+            elif not sharded and product.stock < quantity:
+                results[index] = SETTLE_SOLD_OUT
+            elif user.balance < product.price * quantity:
+                results[index] = SETTLE_NO_BALANCE
+
+            if results[index] is not None:
+                if index in taken_shards:
+                    restore_shard_stock(product_id, taken_shards[index], quantity)
+                continue
+
+            total_amount = product.price * quantity
+            if not sharded:
+                product.stock -= quantity
+            user.balance -= total_amount
+            order_rows.append({
+                'product_id': product.id,
+                'user_id': user.id,
+                'quantity': quantity,
+                'product_price': product.price,
+                'created_at': now
+            })
+            flash_sale_rows.append({
+                'product_id': product.id,
+                'user_id': user.id,
+                'amount': total_amount,
+                'purchase_time': now
+            })
+            results[index] = SETTLE_SUCCESS
+
+    if order_rows:
+        db.session.execute(Order.__table__.insert(), order_rows)
+        db.session.execute(FlashSaleOrder.__table__.insert(), flash_sale_rows)
+    return results
+
+
+def _release_failed_reservations(messages, results, release_on_error=True):
+    """归还失败订单的Redis预扣库存；数据库库存不足说明Redis库存已偏多，不再归还"""
+    for message, result in zip(messages, results):
+        if result == SETTLE_ERROR and not release_on_error:
+            continue
+        if message.get('reserved') and result not in (SETTLE_SUCCESS, SETTLE_SOLD_OUT):
+            release_stock(message['product_id'], message['user_id'], message['quantity'])
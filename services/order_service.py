@@ -0,0 +1,185 @@
+import base64
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import update, case, select, or_, and_
+from models import db, Product, Order, CartItem
+from services.stock_shard_service import (
+    get_shard_counts, decrement_shard_stock, remember_shard_count, forget_shard_count
+)
+from plugin.catalog_cache import adjust_cached_stock
+from plugin.product_filter import mark_sold_out
+
+
+class InsufficientStock(Exception):
+    """商品不存在或库存不足，调用方应回滚事务"""
+
+    def __init__(self, product_id):
+        super().__init__(f"Insufficient stock for product {product_id}")
+        self.product_id = product_id
+
+
+def create_cart_order(user_id, cart_id, main_order_id):
+    """
+    按集合处理购物车下单，查询次数与购物车商品数无关：
+        1. 一次查询读取购物车明细，一次分组查询获取分片数
+        2. 未分片商品用一条 IN (...) FOR UPDATE 按ID升序加锁，再用一条带条件的批量UPDATE扣减库存
+        3. 分片商品按ID升序扣减分片库存（加锁顺序与秒杀批量结算一致：先商品行，后分片行）
+        4. 一条批量INSERT写入全部订单行
+    库存不足时抛出 InsufficientStock，由调用方回滚；成功时由本函数提交事务
+    :return: 订单总金额
+    """
+    items = CartItem.query.filter_by(cart_id=cart_id).order_by(CartItem.id).all()
+    needed = defaultdict(int)
+    for item in items:
+        needed[item.product_id] += item.quantity
+    product_ids = sorted(needed)
+
+    shard_counts = get_shard_counts(product_ids)
+    locked_ids = [product_id for product_id in product_ids if not shard_counts[product_id]]
+    sharded_ids = [product_id for product_id in product_ids if shard_counts[product_id]]
+
+    products = {}
+    shard_ranges = {}  # 本进程缓存未过期、实际已开启分片的商品 -> 全部分片号
+    if locked_ids:
+        products.update({
+            product.id: product for product in
+            Product.query.filter(Product.id.in_(locked_ids)).order_by(Product.id).with_for_update().populate_existing().all()
+        })
+        # 商品行已加锁，分片标记不会再变；其他进程已开启分片的商品改为扣减分片
+        for product_id in locked_ids:
+            product = products.get(product_id)
+            if product is not None and product.shard_count:
+                remember_shard_count(product_id, product.shard_count)
+                shard_ranges[product_id] = range(product.shard_count)
+        locked_ids = [product_id for product_id in locked_ids if product_id not in shard_ranges]
+        sharded_ids = sorted(sharded_ids + list(shard_ranges))
+    if sharded_ids:
+        products.update({
+            product.id: product for product in Product.query.filter(Product.id.in_(sharded_ids)).all()
+        })
+
+    for product_id in product_ids:
+        product = products.get(product_id)
+        if product is None or (product_id in locked_ids and product.stock < needed[product_id]):
+            raise InsufficientStock(product_id)
+
+    if locked_ids:
+        # UPDATE product SET stock = stock - CASE id ... END WHERE id IN (...) AND stock >= CASE id ... END
+        quantity = case({product_id: needed[product_id] for product_id in locked_ids}, value=Product.id)
+        updated = db.session.execute(
+            update(Product)
+            .where(Product.id.in_(locked_ids), Product.stock >= quantity, Product.shard_count == 0)
+            .values(stock=Product.stock - quantity)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if updated != len(locked_ids):
+            raise InsufficientStock(locked_ids[0])
+
+    for product_id in sharded_ids:
+        if decrement_shard_stock(product_id, needed[product_id], shard_ranges.get(product_id)) is None:
+            forget_shard_count(product_id)  # 分片可能已被取消，下次重新读取
+            raise InsufficientStock(product_id)
+
+    now = datetime.utcnow()
+    total_amount = 0
+    rows = []
+    for item in items:
+        product = products[item.product_id]
+        total_amount += product.price * item.quantity
+        rows.append({
+            'product_id': product.id,
+            'user_id': user_id,
+            'quantity': item.quantity,
+            'product_price': product.price,
+            'main_order_id': main_order_id,
+            'created_at': now
+        })
+    if rows:
+        db.session.execute(Order.__table__.insert(), rows)
+
+    sold_out = [product_id for product_id in locked_ids if products[product_id].stock == needed[product_id]]
+    db.session.commit()
+
+    adjust_cached_stock({product_id: -quantity for product_id, quantity in needed.items()})
+    for product_id in sold_out:
+        mark_sold_out(product_id)
+    return total_amount
+
+
+# 订单历史的支付状态筛选
+HISTORY_STATUSES = {'all': None, 'pending': 0, 'paid': 1}
+
+
+class InvalidCursor(ValueError):
+    """分页游标无法解析"""
+
+
+def encode_history_cursor(created_at, order_id):
+    raw = f"{created_at.isoformat()}|{order_id}".encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_history_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        created_at, order_id = raw.split('|')
+        return datetime.fromisoformat(created_at), int(order_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursor(str(e)) from e
+
+
+def get_order_history(user_id, status=None, cursor=None, limit=20):
+    """
+    按下单时间倒序分页查询用户的订单行，使用 (created_at, id) 键集分页，不使用OFFSET：
+        先在 (user_id[, payment_status], created_at, id) 索引上范围扫描取出本页的订单ID，
+        再按主键回表读取这些订单行和商品名，每页耗时与历史订单总数无关
+    :param status: None 表示全部，0 未支付，1 已支付
+    :param cursor: 上一页返回的 next_cursor
+    :return: (订单列表, 下一页游标或None)
+    """
+    conditions = [Order.user_id == user_id]
+    if status is not None:
+        conditions.append(Order.payment_status == status)
+    if cursor:
+        created_at, order_id = decode_history_cursor(cursor)
+        conditions.append(or_(
+            Order.created_at < created_at,
+            and_(Order.created_at == created_at, Order.id < order_id)
+        ))
+
+    # 多取一行判断是否还有下一页
+    page = (
+        select(Order.id)
+        .where(*conditions)
+        .order_by(Order.created_at.desc(), Order.id.desc())
+        .limit(limit + 1)
+        .subquery()
+    )
+    rows = db.session.execute(
+        select(
+            Order.id, Order.main_order_id, Order.product_id, Product.name, Order.quantity,
+            Order.product_price, Order.status, Order.payment_status, Order.created_at
+        )
+        .join(page, page.c.id == Order.id)
+        .outerjoin(Product, Product.id == Order.product_id)
+        .order_by(Order.created_at.desc(), Order.id.desc())
+    ).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_history_cursor(rows[-1].created_at, rows[-1].id)
+
+    orders = [{
+        'order_id': row.id,
+        'main_order_id': row.main_order_id,
+        'product_id': row.product_id,
+        'product_name': row.name,
+        'quantity': row.quantity,
+        'price': float(row.product_price),
+        'total_price': float(row.product_price * row.quantity),
+        'status': row.status,
+        'payment_status': row.payment_status,
+        'created_at': row.created_at.strftime('%Y-%m-%d %H:%M:%S')
+    } for row in rows]
+    return orders, next_cursor
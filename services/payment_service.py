@@ -0,0 +1,60 @@
+from sqlalchemy import update
+from models import db, User, Order
+from plugin.order_cache import invalidate_order
+
+# 支付结果
+PAY_SUCCESS = 'success'
+PAY_NOT_FOUND = 'not_found'  # 订单不存在或不属于该用户
+PAY_ALREADY_PAID = 'already_paid'  # 订单已全部支付
+PAY_NO_BALANCE = 'insufficient_balance'  # 余额不足
+
+
+def pay_order(user_id, main_order_id):
+    """
+    在一个短事务内完成支付，不在Python中读改写余额：
+        1. SELECT ... FOR UPDATE 锁定该主订单下未支付的订单行并计算金额
+        2. 条件扣减余额：UPDATE user SET balance = balance - :amt WHERE id = :id AND balance >= :amt
+        3. 条件更新订单：UPDATE order SET payment_status = 1 WHERE ... AND payment_status = 0
+    并发或重复支付时，后到的请求在第1步等待锁，拿到锁后已没有未支付的订单行，不会重复扣款
+    数据库异常向上抛出，由调用方回滚
+    :return: (支付结果, 支付金额)
+    """
+    rows = db.session.query(Order.id, Order.product_price, Order.quantity).filter(
+        Order.main_order_id == main_order_id,
+        Order.user_id == user_id,
+        Order.payment_status == 0
+    ).order_by(Order.id).with_for_update().all()
+    if not rows:
+        exists = db.session.query(Order.id).filter(
+            Order.main_order_id == main_order_id, Order.user_id == user_id
+        ).first() is not None
+        db.session.rollback()
+        return (PAY_ALREADY_PAID if exists else PAY_NOT_FOUND), 0
+
+    order_ids = [row.id for row in rows]
+    total_amount = sum(row.product_price * row.quantity for row in rows)
+
+    balance_updated = db.session.execute(
+        update(User)
+        .where(User.id == user_id, User.balance >= total_amount)
+        .values(balance=User.balance - total_amount)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not balance_updated:
+        db.session.rollback()
+        return PAY_NO_BALANCE, total_amount
+
+    paid = db.session.execute(
+        update(Order)
+        .where(Order.id.in_(order_ids), Order.payment_status == 0)
+        .values(payment_status=1)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if paid != len(order_ids):
+        # 订单行已加锁，正常情况下不会发生；出现时整体回滚，不扣款
+        db.session.rollback()
+        return PAY_ALREADY_PAID, 0
+
+    db.session.commit()
+    invalidate_order(main_order_id)
+    return PAY_SUCCESS, total_amount
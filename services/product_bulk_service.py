@@ -0,0 +1,190 @@
+import csv
+import io
+from sqlalchemy import select
+from models import db, Product
+from config import BULK_PRODUCT_CONFIG
+from utils.cache_serializer import dumps, loads
+from plugin.catalog_cache import bump_catalog_version, adjust_product_count
+from plugin.product_filter import rebuild_from_db
+from plugin.product_search import build_search_index
+
+FORMAT_NDJSON = 'ndjson'
+FORMAT_CSV = 'csv'
+EXPORT_FIELDS = ('id', 'name', 'price', 'stock')
+NAME_MAX_LENGTH = Product.__table__.c.name.type.length
+
+
+def iter_records(stream, fmt):
+    """
+    逐行解析请求体，不把整个文件读入内存
+    :return: (行号, 原始记录或None, 解析错误或None) 的迭代器
+    """
+    if fmt == FORMAT_CSV:
+        reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+        for record in reader:
+            yield reader.line_num, record, None
+        return
+
+    for line_no, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = loads(line)
+        except ValueError as e:
+            yield line_no, None, f"JSON格式错误: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield line_no, None, "每行应为一个JSON对象"
+            continue
+        yield line_no, record, None
+
+
+def validate_record(record):
+    """校验并转换一行商品数据，返回 (行数据, 错误信息)"""
+    name = record.get('name')
+    if not isinstance(name, str) or not name.strip():
+        return None, "name不能为空"
+    name = name.strip()
+    if len(name) > NAME_MAX_LENGTH:
+        return None, f"name长度不能超过{NAME_MAX_LENGTH}"
+    try:
+        price = float(record.get('price'))
+        stock = int(record.get('stock'))
+    except (TypeError, ValueError):
+        return None, "price或stock格式错误"
+    if price < 0 or stock < 0:
+        return None, "price和stock不能为负数"
+    return {'name': name, 'price': price, 'stock': stock}, None
+
+
+class ImportReport:
+    def __init__(self, max_errors):
+        self.max_errors = max_errors
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []
+        self.aborted = False  # 请求体中途无法解析，之后的内容未读取
+
+    def error(self, line_no, message):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line_no, 'error': message})
+
+    def to_dict(self):
+        return {
+            'inserted': self.inserted,
+            'failed': self.failed,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors),
+            'aborted': self.aborted
+        }
+
+
+def import_products(records):
+    """
+    分批插入商品：每批一次executemany、一次提交，事务大小不超过 BATCH_SIZE 行
+    整批插入失败时逐行重试，定位出错的行
+    请求体中途无法解码或解析时记录错误并停止读取，已读取的行照常写入，已提交的批次照常刷新缓存
+    """
+    report = ImportReport(BULK_PRODUCT_CONFIG['MAX_ERRORS'])
+    batch = []
+    records = iter(records)
+    line_no = 0
+    while True:
+        try:
+            line_no, record, error = next(records)
+        except StopIteration:
+            break
+        except (UnicodeDecodeError, ValueError, csv.Error) as e:
+            report.error(line_no + 1, f"请求体无法解析，已停止读取: {e}")
+            report.aborted = True
+            break
+        if error is None:
+            row, error = validate_record(record)
+        if error is not None:
+            report.error(line_no, error)
+            continue
+        batch.append((line_no, row))
+        if len(batch) >= BULK_PRODUCT_CONFIG['BATCH_SIZE']:
+            _insert_batch(batch, report)
+            batch = []
+    if batch:
+        _insert_batch(batch, report)
+
+    if report.inserted:
+        # 批量插入拿不到新商品ID，直接从数据库重建过滤器、商品总数和搜索索引
+        bump_catalog_version()
+        try:
+            rebuild_from_db()
+        except Exception as e:
+            print(f"重建商品过滤器失败: {e}")
+            adjust_product_count(report.inserted)
+        try:
+            build_search_index()
+        except Exception as e:
+            print(f"重建商品搜索索引失败: {e}")
+    return report
+
+
+def _insert_batch(batch, report):
+    try:
+        db.session.execute(Product.__table__.insert(), [row for _, row in batch])
+        db.session.commit()
+        report.inserted += len(batch)
+        return
+    except Exception as e:
+        db.session.rollback()
+        print(f"批量插入商品失败: {e}, 改为逐行插入")
+
+    for line_no, row in batch:
+        try:
+            db.session.execute(Product.__table__.insert(), [row])
+            db.session.commit()
+            report.inserted += 1
+        except Exception as e:
+            db.session.rollback()
+            report.error(line_no, f"写入数据库失败: {e}")
+
+
+def export_products(fmt):
+    """
+    按主键顺序导出全部商品，使用服务端游标逐批读取，内存占用与表大小无关
+    :return: 字节串迭代器
+    """
+    statement = select(Product.id, Product.name, Product.price, Product.stock).order_by(Product.id)
+    result = db.session.execute(statement.execution_options(stream_results=True))
+    try:
+        if fmt == FORMAT_CSV:
+            yield (','.join(EXPORT_FIELDS) + '\r\n').encode('utf-8')
+        for rows in result.partitions(BULK_PRODUCT_CONFIG['EXPORT_CHUNK']):
+            if fmt == FORMAT_CSV:
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(rows)
+                yield buffer.getvalue().encode('utf-8')
+            else:
+                yield b''.join(dumps(dict(zip(EXPORT_FIELDS, row))) + b'\n' for row in rows)
+    finally:
+        result.close()
+        db.session.rollback()
+
+
+def stream_products(after_id=0, page_size=None):
+    """
+    按主键分页逐页读取商品并输出NDJSON，每页一条短查询（id > 上一页最后ID），
+    读完一页即释放连接，内存占用和首字节时间与商品总数无关
+    :param after_id: 从该ID之后开始，用于断点续传
+    :return: 字节串迭代器，每页一个数据块
+    """
+    page_size = page_size or BULK_PRODUCT_CONFIG['EXPORT_CHUNK']
+    statement = select(Product.id, Product.name, Product.price, Product.stock).order_by(Product.id).limit(page_size)
+    last_id = after_id
+    while True:
+        rows = db.session.execute(statement.where(Product.id > last_id)).all()
+        db.session.rollback()  # 每页结束事务，连接在客户端读取期间归还连接池
+        if not rows:
+            return
+        yield b''.join(dumps(dict(zip(EXPORT_FIELDS, row))) + b'\n' for row in rows)
+        if len(rows) < page_size:
+            return
+        last_id = rows[-1][0]
@@ -0,0 +1,213 @@
+import random
+import threading
+import time
+from sqlalchemy import update, delete
+from models import db, Product, ProductStockShard
+from config import STOCK_SHARD_CONFIG
+from plugin.catalog_cache import set_cached_stock
+
+# 商品ID -> (分片数, 缓存时间)
+# 只用来选择扣减路径，是否分片以商品行上的 Product.shard_count 为准：扣减商品行的语句要求 shard_count = 0，
+# 其他进程开启分片后本进程缓存未过期也不会扣到商品行上，扣减失败时按加锁读到的最新标记改走分片
+_shard_counts = {}
+
+
+def remember_shard_count(product_id, count):
+    _shard_counts[product_id] = (count, time.time())
+
+
+def forget_shard_count(product_id):
+    _shard_counts.pop(product_id, None)
+
+
+def get_shard_count(product_id):
+    """商品的库存分片数，0表示未分片"""
+    cached = _shard_counts.get(product_id)
+    if cached and time.time() - cached[1] < STOCK_SHARD_CONFIG['CACHE_TTL']:
+        return cached[0]
+    count = db.session.query(Product.shard_count).filter(Product.id == product_id).scalar() or 0
+    remember_shard_count(product_id, count)
+    return count
+
+
+def get_shard_counts(product_ids):
+    """批量获取商品分片数，未缓存的商品用一条查询补齐，返回 {商品ID: 分片数}"""
+    now = time.time()
+    counts = {}
+    missing = []
+    for product_id in product_ids:
+        cached = _shard_counts.get(product_id)
+        if cached and now - cached[1] < STOCK_SHARD_CONFIG['CACHE_TTL']:
+            counts[product_id] = cached[0]
+        else:
+            missing.append(product_id)
+    if missing:
+        found = dict(db.session.query(Product.id, Product.shard_count).filter(Product.id.in_(missing)).all())
+        for product_id in missing:
+            counts[product_id] = found.get(product_id) or 0
+            remember_shard_count(product_id, counts[product_id])
+    return counts
+
+
+def lock_shards(product_id):
+    """
+    按 商品行 -> 分片行 的顺序加锁，与所有扣减路径的加锁顺序一致；调用方负责提交事务
+    :return: (商品行上的库存, 分片列表)，商品不存在时返回 (None, [])，未分片商品的分片列表为空
+    """
+    row = db.session.query(Product.stock, Product.shard_count).filter(
+        Product.id == product_id
+    ).with_for_update().first()
+    if row is None:
+        return None, []
+    remember_shard_count(product_id, row.shard_count)
+    if not row.shard_count:
+        return row.stock, []
+    shards = ProductStockShard.query.filter_by(product_id=product_id).order_by(
+        ProductStockShard.shard_no
+    ).with_for_update().all()
+    return row.stock, shards
+
+
+def decrement_stock(product_id, quantity):
+    """条件扣减库存，分片商品扣减分片，否则扣减 Product.stock；调用方负责提交事务"""
+    if get_shard_count(product_id):
+        if decrement_shard_stock(product_id, quantity) is not None:
+            return True
+        forget_shard_count(product_id)  # 分片可能已被取消，下次重新读取
+        return False
+
+    # UPDATE product SET stock = stock - :q WHERE id = :id AND stock >= :q AND shard_count = 0
+    if db.session.execute(
+        update(Product)
+        .where(Product.id == product_id, Product.stock >= quantity, Product.shard_count == 0)
+        .values(stock=Product.stock - quantity)
+        .execution_options(synchronize_session=False)
+    ).rowcount > 0:
+        return True
+
+    # 库存不足，或其他进程已开启分片：加锁读取最新分片标记
+    shard_count = locked_shard_count(product_id)
+    if shard_count:
+        return decrement_shard_stock(product_id, quantity, range(shard_count)) is not None
+    return False
+
+
+def locked_shard_count(product_id):
+    """加锁读取商品行上的分片数，读到的是最新提交的值；商品不存在时返回0"""
+    count = db.session.query(Product.shard_count).filter(Product.id == product_id).with_for_update().scalar() or 0
+    remember_shard_count(product_id, count)
+    return count
+
+
+def decrement_shard_stock(product_id, quantity, shard_nos=None):
+    """
+    随机选择一个库存充足的分片扣减，失败时依次尝试其余分片
+    :param shard_nos: 要尝试的分片号；为None时先用非加锁读筛出候选分片，减少对空分片的无效加锁。
+        事务快照早于开启分片时非加锁读看不到新分片，此时应传入全部分片号
+    :return: 扣减成功的分片号，所有分片都不足时返回None
+    """
+    if shard_nos is None:
+        shard_nos = [row[0] for row in db.session.query(ProductStockShard.shard_no).filter(
+            ProductStockShard.product_id == product_id,
+            ProductStockShard.stock >= quantity
+        )]
+    shard_nos = list(shard_nos)
+    random.shuffle(shard_nos)
+    for shard_no in shard_nos:
+        updated = db.session.execute(
+            update(ProductStockShard)
+            .where(ProductStockShard.product_id == product_id,
+                   ProductStockShard.shard_no == shard_no,
+                   ProductStockShard.stock >= quantity)
+            .values(stock=ProductStockShard.stock - quantity)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if updated:
+            return shard_no
+    return None
+
+
+def restore_shard_stock(product_id, shard_no, quantity):
+    """归还同一事务中已扣减的分片库存"""
+    db.session.execute(
+        update(ProductStockShard)
+        .where(ProductStockShard.product_id == product_id, ProductStockShard.shard_no == shard_no)
+        .values(stock=ProductStockShard.stock + quantity)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def reset_shards(product_id, total, shard_count=None):
+    """
+    按总库存重新划分分片，并同步 Product.stock 和 Product.shard_count；调用方负责提交事务
+    :param shard_count: 新的分片数，None表示沿用当前分片数，0表示取消分片
+    """
+    _, existing = lock_shards(product_id)
+    if shard_count is None:
+        shard_count = len(existing)
+
+    db.session.execute(delete(ProductStockShard).where(ProductStockShard.product_id == product_id))
+    if shard_count:
+        base, extra = divmod(total, shard_count)
+        db.session.execute(ProductStockShard.__table__.insert(), [{
+            'product_id': product_id,
+            'shard_no': shard_no,
+            'stock': base + (1 if shard_no < extra else 0)
+        } for shard_no in range(shard_count)])
+    # 分片标记与库存在同一条语句中更新，提交后扣减商品行的条件UPDATE立即不再匹配
+    db.session.execute(
+        update(Product).where(Product.id == product_id).values(stock=total, shard_count=shard_count)
+        .execution_options(synchronize_session=False)
+    )
+    remember_shard_count(product_id, shard_count)
+
+
+def locked_shard_total(product_id):
+    """
+    锁定商品的库存行并返回当前总库存：分片商品为全部分片之和，未分片商品为 Product.stock；调用方负责提交事务
+    :return: 总库存，商品不存在时返回None
+    """
+    stock, shards = lock_shards(product_id)
+    if shards:
+        return sum(shard.stock for shard in shards)
+    return stock
+
+
+def rebalance_shards(product_id):
+    """把分片库存重新均分，并将总量写回 Product.stock，返回总库存；商品已取消分片时返回None"""
+    _, shards = lock_shards(product_id)
+    if not shards:
+        db.session.rollback()
+        return None
+
+    total = sum(shard.stock for shard in shards)
+    base, extra = divmod(total, len(shards))
+    for index, shard in enumerate(shards):
+        shard.stock = base + (1 if index < extra else 0)
+    db.session.execute(
+        update(Product).where(Product.id == product_id).values(stock=total)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    set_cached_stock(product_id, total)
+    return total
+
+
+def start_shard_rebalancer(app, interval):
+    """启动后台线程，定期均衡所有分片商品的库存"""
+    def run():
+        while True:
+            time.sleep(interval)
+            with app.app_context():
+                try:
+                    product_ids = [row[0] for row in db.session.query(Product.id).filter(Product.shard_count > 0)]
+                    db.session.rollback()  # 结束只读事务，避免长事务持有快照
+                    for product_id in product_ids:
+                        rebalance_shards(product_id)
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"库存分片均衡失败: {e}")
+
+    thread = threading.Thread(target=run, name='stock-shard-rebalancer', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,106 @@
+from sqlalchemy import update
+from models import db, Product
+from utils.redis_util import redis_client
+from plugin.catalog_cache import bump_catalog_version, set_cached_stock, evict_products
+from plugin.flash_sale_stock import adjust_stock, invalidate_stock
+from plugin.product_filter import update_stock_state
+from plugin.product_search import update_indexed_stock
+from services.stock_shard_service import get_shard_count, lock_shards, reset_shards
+
+# 单条操作失败原因
+STOCK_NOT_FOUND = 'not_found'
+STOCK_NEGATIVE = 'negative_stock'
+
+
+def apply_stock_operations(operations):
+    """
+    在一个事务内批量修改库存
+    与秒杀批量结算的加锁顺序一致，避免死锁：先按ID升序处理未分片商品的商品行，再按ID升序处理分片商品（先商品行后分片行）；
+    delta 在SQL中原子增减（stock = stock + :delta），不会覆盖并发订单的扣减
+    :param operations: [{'product_id': int, 'delta': int} 或 {'product_id': int, 'set': int}]
+    :return: (成功时各商品的最新库存 {商品ID: 库存}, 失败列表)；有失败时整批回滚
+    """
+    sharded = {operation['product_id']: bool(get_shard_count(operation['product_id'])) for operation in operations}
+    failures = []
+    for operation in sorted(operations, key=lambda item: (sharded[item['product_id']], item['product_id'])):
+        product_id = operation['product_id']
+        reason = _apply(product_id, operation.get('delta'), operation.get('set'), sharded[product_id])
+        if reason:
+            failures.append(dict(operation, error=reason))
+
+    if failures:
+        db.session.rollback()
+        return None, failures
+
+    product_ids = sorted({operation['product_id'] for operation in operations})
+    stocks = dict(db.session.query(Product.id, Product.stock).filter(Product.id.in_(product_ids)).all())
+    db.session.commit()
+    return stocks, []
+
+
+def _apply(product_id, delta, value, sharded):
+    if not sharded:
+        if value is not None:
+            statement = update(Product).where(Product.id == product_id, Product.shard_count == 0).values(stock=value)
+        else:
+            statement = (
+                update(Product)
+                .where(Product.id == product_id, Product.stock + delta >= 0, Product.shard_count == 0)
+                .values(stock=Product.stock + delta)
+            )
+        if db.session.execute(statement.execution_options(synchronize_session=False)).rowcount:
+            return None
+
+    # 分片商品，或未分片商品未更新成功（商品不存在、库存将变为负数、其他进程已开启分片）：
+    # 按 商品行 -> 分片行 加锁后以最新状态计算总量
+    stock, shards = lock_shards(product_id)
+    if stock is None:
+        return STOCK_NOT_FOUND
+    total = value if value is not None else (sum(shard.stock for shard in shards) if shards else stock) + delta
+    if total < 0:
+        return STOCK_NEGATIVE
+    if shards:
+        reset_shards(product_id, total)
+    else:
+        db.session.execute(
+            update(Product).where(Product.id == product_id).values(stock=total)
+            .execution_options(synchronize_session=False)
+        )
+    return None
+
+
+def refresh_stock_caches(operations, stocks):
+    """
+    事务提交后用一条管道刷新Redis：商品缓存、秒杀预扣库存、售罄过滤器、目录版本号
+    刷新失败时删除商品缓存，其余数据由各自的过期和定期重建修正
+    """
+    for product_id, stock in stocks.items():
+        update_indexed_stock(product_id, stock)
+
+    if redis_client is None:
+        for product_id, stock in stocks.items():
+            update_stock_state(product_id, stock)
+        return
+
+    deltas = {}
+    reset_ids = set()
+    for operation in operations:
+        if operation.get('set') is not None:
+            reset_ids.add(operation['product_id'])
+        else:
+            deltas[operation['product_id']] = deltas.get(operation['product_id'], 0) + operation['delta']
+
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for product_id, stock in stocks.items():
+            set_cached_stock(product_id, stock, client=pipe)
+            if product_id in reset_ids:
+                invalidate_stock(product_id, pipe)
+            elif deltas.get(product_id):
+                adjust_stock(product_id, deltas[product_id], pipe)
+            update_stock_state(product_id, stock, client=pipe)
+        bump_catalog_version(client=pipe)
+        pipe.execute()
+    except Exception as e:
+        print(f"刷新Redis库存缓存失败: {e}")
+        evict_products(list(stocks))
@@ -0,0 +1,40 @@
+import json
+from config import MESSAGE_BROKER_CONFIG
+from plugin.message_broker import InProcessBroker, dead_letter_queue
+from services import flash_sale_consumer
+from services.flash_sale_consumer import ATTEMPT_HEADER, REASON_HEADER, retry_or_dead_letter
+
+QUEUE = 'flash_sale_test'
+
+
+def test_memory_backend_retries_until_dead_letter(monkeypatch):
+    # 立即重试，避免延迟投递的定时器；结果和库存归还不访问Redis
+    monkeypatch.setitem(MESSAGE_BROKER_CONFIG, 'RETRY_DELAYS', [0])
+    results = []
+    monkeypatch.setattr(flash_sale_consumer, 'save_result', lambda ticket, result: results.append(result))
+    monkeypatch.setattr(flash_sale_consumer, 'release_stock', lambda *args: None)
+
+    broker = InProcessBroker(10)
+    consumer = broker.consumer(QUEUE, prefetch=1)
+    message = {'user_id': 1, 'product_id': 2, 'quantity': 1, 'ticket': 't'}
+    body = json.dumps(message).encode()
+    broker.publish(QUEUE, body)
+
+    attempts = []
+    for _ in range(MESSAGE_BROKER_CONFIG['MAX_ATTEMPTS']):
+        deliveries = consumer.fetch(1, timeout=1)
+        assert len(deliveries) == 1
+        delivery = deliveries[0]
+        assert delivery.body == body
+        assert delivery.tag is None
+        attempts.append(delivery.headers.get(ATTEMPT_HEADER, 0))
+        retry_or_dead_letter(broker, consumer, QUEUE, delivery, message)
+
+    assert attempts == list(range(MESSAGE_BROKER_CONFIG['MAX_ATTEMPTS']))
+    assert broker.queue_depth(QUEUE) == 0
+    assert results == [flash_sale_consumer.SETTLE_ERROR]
+
+    dead = broker.consumer(dead_letter_queue(QUEUE), prefetch=1).fetch(1, timeout=1)
+    assert len(dead) == 1
+    assert dead[0].headers[REASON_HEADER] == 'max_attempts'
+    assert dead[0].headers[ATTEMPT_HEADER] == MESSAGE_BROKER_CONFIG['MAX_ATTEMPTS']
@@ -0,0 +1,63 @@
+"""
+缓存序列化工具
+
+缓存值统一存为JSON字节串，首字节为格式标记：
+    b'J' 未压缩的JSON
+    b'Z' zlib压缩的JSON
+命中缓存时用 decode_json 取出JSON字节串即可直接作为响应体返回，不需要反序列化。
+"""
+import json
+import zlib
+from config import CACHE_CONFIG
+
+try:
+    import orjson
+except ImportError:  # orjson未安装时退回标准库
+    orjson = None
+
+RAW_PREFIX = b'J'
+ZLIB_PREFIX = b'Z'
+
+
+def dumps(data):
+    """Python对象 -> JSON字节串"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def loads(raw):
+    """JSON字节串 -> Python对象"""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def encode(data):
+    """序列化为缓存值，超过阈值时压缩"""
+    return encode_json(dumps(data))
+
+
+def encode_json(raw):
+    """已序列化的JSON字节串 -> 缓存值"""
+    if len(raw) >= CACHE_CONFIG['COMPRESS_MIN_BYTES']:
+        return ZLIB_PREFIX + zlib.compress(raw, CACHE_CONFIG['COMPRESS_LEVEL'])
+    return RAW_PREFIX + raw
+
+
+def decode_json(value):
+    """缓存值 -> JSON字节串；无法识别的旧格式数据返回None，按未命中处理"""
+    if not value:
+        return None
+    prefix, body = value[:1], value[1:]
+    if prefix == RAW_PREFIX:
+        return body
+    if prefix == ZLIB_PREFIX:
+        return zlib.decompress(body)
+    return None
+
+
+def decode(value):
+    """缓存值 -> Python对象"""
+    raw = decode_json(value)
+    return None if raw is None else loads(raw)